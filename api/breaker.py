@@ -0,0 +1,118 @@
+import time
+import threading
+import requests
+import config
+
+
+CLOSED = "closed"        # контроллер отвечает, запросы идут как обычно
+OPEN = "open"            # контроллер недоступен, запросы сразу получают отказ
+HALF_OPEN = "half_open"  # пауза истекла, один пробный запрос уже в пути
+
+
+class ControllerUnavailable(requests.ConnectionError):
+    """Предохранитель разомкнут: запрос к контроллеру даже не отправлялся"""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для контроллера станка.
+    После failures сетевых ошибок подряд размыкается: запросы не ждут таймаутов,
+    а сразу получают ControllerUnavailable. Через паузу (backoff, удваивается
+    до backoff_max) пропускается один пробный запрос; успех замыкает цепь.
+    """
+
+    def __init__(self, failures=None, backoff=None, backoff_max=None):
+        options = config.CONTROLLER_BREAKER
+        self.max_failures = failures or options["failures"]
+        self.backoff = backoff or options["backoff"]
+        self.backoff_max = backoff_max or options["backoff_max"]
+
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = self.backoff
+        self.retry_at = 0.0
+        self.opened_at = None
+        self.last_error = None
+        self.fast_failed = 0
+        # Подписчики на смену состояния: fn(status)
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Можно ли отправить запрос сейчас"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self.state = HALF_OPEN
+                changed = True
+            else:
+                self.fast_failed += 1
+                return False
+        if changed:
+            self._notify()
+        return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == CLOSED:
+                return
+            self.state = CLOSED
+            self.delay = self.backoff
+            self.opened_at = None
+        self._notify()
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == OPEN:
+                return
+            if self.state == CLOSED and self.failures < self.max_failures:
+                return
+            # Порог достигнут или пробный запрос не прошёл
+            if self.state == CLOSED:
+                self.opened_at = time.time()
+            self.state = OPEN
+            self.retry_at = time.monotonic() + self.delay
+            self.delay = min(self.delay * 2, self.backoff_max)
+        self._notify()
+
+    def record_aborted(self):
+        """
+        Запрос оборвался не сетевой ошибкой (обрыв тела ответа, отмена таска):
+        в CLOSED не считается, а пробный запрос HALF_OPEN — неудача, иначе
+        предохранитель остался бы в HALF_OPEN навсегда
+        """
+        with self._lock:
+            if self.state != HALF_OPEN:
+                return
+            self.state = OPEN
+            self.retry_at = time.monotonic() + self.delay
+            self.delay = min(self.delay * 2, self.backoff_max)
+        self._notify()
+
+    def due(self):
+        """Пора ли делать пробный запрос"""
+        return self.state == OPEN and time.monotonic() >= self.retry_at
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "available": self.state == CLOSED,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "opened_at": self.opened_at,
+                "retry_in": round(max(self.retry_at - time.monotonic(), 0), 2) if self.state == OPEN else None,
+                "fast_failed": self.fast_failed,
+            }
+
+    def _notify(self):
+        status = self.status()
+        for listener in self.listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                print(f"⚠️ Ошибка подписчика предохранителя: {e}")
@@ -0,0 +1,167 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import config
+import metrics
+from api.breaker import CircuitBreaker, ControllerUnavailable
+
+
+# Статусы, при которых GET-запрос имеет смысл повторить
+RETRY_STATUSES = (502, 503, 504)
+
+
+class ControllerClient:
+    """Общий HTTP-клиент к контроллеру станка с пулом keep-alive соединений"""
+
+    def __init__(self, base_url, pool_size=None, pool_block=None, timeouts=None, retries=None,
+                 breaker=None, health_path=None, name=None):
+        self.base_url = base_url.rstrip("/")
+        self.name = name or config.DEFAULT_MACHINE  # id станка для метрик
+        self.timeouts = timeouts if timeouts is not None else config.CONTROLLER_TIMEOUTS
+        self.retries = retries if retries is not None else config.CONTROLLER_RETRIES
+
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size or config.CONTROLLER_POOL_SIZE,
+            pool_block=config.CONTROLLER_POOL_BLOCK if pool_block is None else pool_block,
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        # Пока контроллер недоступен, запросы не ждут таймаутов
+        self.breaker = breaker or CircuitBreaker()
+        self.health_path = health_path or config.CONTROLLER_HEALTH_PATH
+
+    # --- Политики по эндпоинтам ---
+    def timeout_for(self, endpoint):
+        return self.timeouts.get(endpoint, self.timeouts.get("default", 5))
+
+    def retry_policy(self, endpoint):
+        return self.retries.get(endpoint, self.retries.get("default", {"retries": 0, "backoff": 0.1}))
+
+    # --- Статистика ---
+    def _record(self, endpoint, started, error=False, retry=False):
+        latency_ms = (time.monotonic() - started) * 1000
+        metrics.controller_request_seconds.observe(latency_ms / 1000, self.name, endpoint)
+        if error:
+            metrics.controller_errors_total.inc(self.name, endpoint)
+        if retry:
+            metrics.controller_retries_total.inc(self.name, endpoint)
+        with self._lock:
+            s = self._stats.setdefault(endpoint, {
+                "requests": 0, "errors": 0, "retries": 0,
+                "latency_total_ms": 0.0, "latency_max_ms": 0.0, "last_latency_ms": 0.0,
+            })
+            s["requests"] += 1
+            s["latency_total_ms"] += latency_ms
+            s["latency_max_ms"] = max(s["latency_max_ms"], latency_ms)
+            s["last_latency_ms"] = latency_ms
+            if error:
+                s["errors"] += 1
+            if retry:
+                s["retries"] += 1
+
+    def stats(self):
+        """Снимок счётчиков по эндпоинтам"""
+        with self._lock:
+            result = {}
+            for endpoint, s in self._stats.items():
+                item = dict(s)
+                item["latency_avg_ms"] = round(s["latency_total_ms"] / s["requests"], 2) if s["requests"] else 0.0
+                item["latency_total_ms"] = round(s["latency_total_ms"], 2)
+                item["latency_max_ms"] = round(s["latency_max_ms"], 2)
+                item["last_latency_ms"] = round(s["last_latency_ms"], 2)
+                result[endpoint] = item
+            return result
+
+    # --- Запросы ---
+    def request(self, endpoint, method, path, **kwargs):
+        """
+        Запрос к контроллеру через общий пул.
+        endpoint — имя для таймаутов, повторов и статистики.
+        Исключения requests пробрасываются как есть; при разомкнутом
+        предохранителе — ControllerUnavailable (наследник requests.ConnectionError).
+        Предохранитель учитывает запрос один раз, после всех повторов:
+        неудача — только сетевая ошибка или таймаут, любой HTTP-ответ (и 5xx) — успех.
+        """
+        if not self.breaker.allow():
+            metrics.controller_fast_fail_total.inc(self.name, endpoint)
+            raise ControllerUnavailable(f"Controller unavailable: {self.breaker.last_error}")
+
+        try:
+            resp = self._send(endpoint, method, path, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.breaker.record_failure(e)
+            raise
+        except BaseException:
+            # Обрыв тела ответа, UploadTooLarge, отмена таска: пробный запрос не должен зависнуть
+            self.breaker.record_aborted()
+            raise
+        self.breaker.record_success()
+        return resp
+
+    def _send(self, endpoint, method, path, **kwargs):
+        """Запрос с повторами по политике эндпоинта"""
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        policy = self.retry_policy(endpoint)
+        # Повторяем только GET — остальные методы могут изменить состояние станка
+        max_retries = policy.get("retries", 0) if method.upper() == "GET" else 0
+        url = self.base_url + path
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(endpoint, started, error=True, retry=attempt > 0)
+                if attempt >= max_retries:
+                    raise
+            else:
+                failed = resp.status_code >= 500
+                self._record(endpoint, started, error=failed, retry=attempt > 0)
+                if resp.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                    return resp
+                resp.close()
+
+            attempt += 1
+            time.sleep(policy.get("backoff", 0.1) * (2 ** (attempt - 1)))
+
+    # --- Здоровье ---
+    def probe(self):
+        """Пробный запрос к контроллеру; исход учитывает предохранитель"""
+        try:
+            self.get("health", self.health_path).close()
+        except requests.RequestException:
+            pass
+
+    def monitor(self, sleep=time.sleep):
+        """
+        Фоновый таск: пока предохранитель разомкнут, проверяет контроллер
+        с нарастающей паузой, чтобы цепь замкнулась и без запросов от браузеров.
+        """
+        while True:
+            if self.breaker.due():
+                self.probe()
+            sleep(0.2)
+
+    def get(self, endpoint, path, **kwargs):
+        return self.request(endpoint, "GET", path, **kwargs)
+
+    def post(self, endpoint, path, **kwargs):
+        return self.request(endpoint, "POST", path, **kwargs)
+
+    def put(self, endpoint, path, **kwargs):
+        return self.request(endpoint, "PUT", path, **kwargs)
+
+    def delete(self, endpoint, path, **kwargs):
+        return self.request(endpoint, "DELETE", path, **kwargs)
+
+
+# Клиент контроллера станка по умолчанию (остальные создаёт api.machines)
+controller = ControllerClient(config.EXTERNAL_API)
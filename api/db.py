@@ -0,0 +1,134 @@
+import sqlite3
+import queue
+from contextlib import contextmanager
+import time
+import config
+import metrics
+
+
+DB_PATH = config.DB_PATH
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, который пишет время каждого запроса в метрики"""
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            metrics.sqlite_query_seconds.observe(time.perf_counter() - started, metrics.statement_label(sql))
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            metrics.sqlite_query_seconds.observe(time.perf_counter() - started, metrics.statement_label(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Соединение с TimedCursor. conn.execute() реализован в C и не вызывает
+    cursor(), поэтому execute/executemany переопределены явно
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+class PoolExhausted(Exception):
+    """Все соединения пула заняты дольше DB_POOL_TIMEOUT"""
+
+
+_pool = queue.LifoQueue()
+_created = 0
+
+
+def open_connection(path=None):
+    """Новое соединение с WAL и настроенными pragma"""
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=config.DB_STATEMENT_CACHE,
+        check_same_thread=False,
+        factory=TimedConnection,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={config.DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA busy_timeout={int(config.DB_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _acquire():
+    global _created
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        pass
+    if _created < config.DB_POOL_SIZE:
+        _created += 1
+        try:
+            return open_connection()
+        except Exception:
+            _created -= 1
+            raise
+    # Пул исчерпан — ждём, пока соединение вернут, но не бесконечно
+    try:
+        return _pool.get(timeout=config.DB_POOL_TIMEOUT)
+    except queue.Empty:
+        raise PoolExhausted(f"No free database connection in {config.DB_POOL_TIMEOUT} s") from None
+
+
+def _release(conn):
+    _pool.put(conn)
+
+
+@contextmanager
+def connect():
+    """
+    Соединение из пула на время блока.
+    Commit при успешном выходе, rollback при исключении.
+    """
+    conn = _acquire()
+    started = time.perf_counter()
+    try:
+        yield conn
+        conn.commit()
+        metrics.sqlite_transaction_seconds.observe(time.perf_counter() - started)
+    except BaseException:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            # Соединение сломано — не возвращаем его в пул
+            _discard(conn)
+            raise
+        _release(conn)
+        raise
+    else:
+        _release(conn)
+
+
+def _discard(conn):
+    global _created
+    _created -= 1
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def close_all():
+    """Закрывает соединения пула (для тестов и бенчмарков)"""
+    while True:
+        try:
+            _discard(_pool.get_nowait())
+        except queue.Empty:
+            break
@@ -0,0 +1,11 @@
+import os
+
+
+def atomic_write(file_path, text):
+    """Запись через временный файл и rename — читатель не увидит файл наполовину"""
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
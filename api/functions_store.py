@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+import threading
+from api.fileutil import atomic_write
+
+
+class VersionConflict(Exception):
+    """If-Match не совпал с текущей версией документа"""
+
+    def __init__(self, etag):
+        super().__init__("Functions were changed by another client")
+        self.etag = etag
+
+
+class FunctionsStore:
+    """
+    functions.json в памяти: файл перечитывается только при смене mtime/размера.
+    Запись атомарная, с проверкой версии (ETag) и по отдельным разделам.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.raw = None
+        self.etag = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        stat = os.stat(self.path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key != self._stat:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = f.read()
+            self.data = json.loads(raw)
+            self.raw = raw
+            self.etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+            self._stat = key
+
+    def get(self):
+        """(data, raw, etag); FileNotFoundError, если файла нет"""
+        with self._lock:
+            self._load()
+            return self.data, self.raw, self.etag
+
+    def _write(self, data):
+        raw = json.dumps(data, ensure_ascii=False, indent=2)
+        atomic_write(self.path, raw)
+        stat = os.stat(self.path)
+        self.data = data
+        self.raw = raw
+        self.etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        return self.etag
+
+    def _check(self, if_match):
+        """if_match(etag) -> bool; None — запись без проверки версии"""
+        if os.path.exists(self.path):
+            self._load()
+        if if_match is not None and self.etag is not None and not if_match(self.etag):
+            raise VersionConflict(self.etag)
+
+    def save(self, data, if_match=None):
+        """Заменяет документ целиком; возвращает новый ETag"""
+        with self._lock:
+            self._check(if_match)
+            return self._write(data)
+
+    def save_section(self, section, value, if_match=None):
+        """Заменяет один раздел (например, Edge_detection); возвращает новый ETag"""
+        with self._lock:
+            self._check(if_match)
+            # Копия через raw, чтобы не портить кэш, если запись не удастся
+            data = json.loads(self.raw) if self.raw is not None else None
+            sections(data, section)[section] = value
+            return self._write(data)
+
+    def get_section(self, section):
+        data, _, etag = self.get()
+        return sections(data, section)[section], etag
+
+
+def sections(data, section):
+    """Словарь разделов документа; KeyError, если раздела нет"""
+    # Старый формат — список с одним объектом
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        data = data[0]
+    if not isinstance(data, dict) or section not in data:
+        raise KeyError(section)
+    return data
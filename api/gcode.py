@@ -0,0 +1,357 @@
+import re
+import math
+import time
+import hashlib
+from array import array
+import config
+
+
+# Слово G-code: буква и число (X-12.5, G01, F3000)
+WORD_RE = re.compile(r"([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))")
+COMMENT_RE = re.compile(r"\([^)]*\)|;.*")
+
+RAPID, CUT = 0, 1
+
+
+def simplify(xs, ys, tolerance):
+    """Индексы точек полилинии после Рамера — Дугласа — Пекера (без рекурсии)"""
+    n = len(xs)
+    if n <= 2 or tolerance <= 0:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    stack = [(0, n - 1)]
+    tol2 = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        length2 = dx * dx + dy * dy
+        worst, worst_d2 = -1, tol2
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if length2:
+                # Квадрат расстояния до прямой через концы отрезка
+                cross = px * dy - py * dx
+                d2 = cross * cross / length2
+            else:
+                d2 = px * px + py * py
+            if d2 > worst_d2:
+                worst, worst_d2 = i, d2
+        if worst != -1:
+            keep[worst] = 1
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [i for i in range(n) if keep[i]]
+
+
+class Preview:
+    """
+    Прореженная траектория: все точки в одном array("d") (x, y подряд),
+    начало каждой полилинии и её тип (RAPID/CUT) — в отдельных массивах.
+    """
+
+    def __init__(self):
+        self.points = array("d")
+        self.starts = array("L")
+        self.kinds = array("B")
+
+    def add(self, kind, xs, ys):
+        self.starts.append(len(self.points) // 2)
+        self.kinds.append(kind)
+        for x, y in zip(xs, ys):
+            self.points.append(x)
+            self.points.append(y)
+
+    def __len__(self):
+        return len(self.points) // 2
+
+    def polylines(self):
+        """(kind, xs, ys) по каждой полилинии"""
+        count = len(self.starts)
+        for i in range(count):
+            start = self.starts[i] * 2
+            end = self.starts[i + 1] * 2 if i + 1 < count else len(self.points)
+            yield self.kinds[i], self.points[start:end:2], self.points[start + 1:end:2]
+
+    def simplified(self, tolerance):
+        """Новый Preview с большим допуском (исходный не меняется)"""
+        result = Preview()
+        for kind, xs, ys in self.polylines():
+            keep = simplify(xs, ys, tolerance)
+            result.add(kind, [xs[i] for i in keep], [ys[i] for i in keep])
+        return result
+
+    def to_json(self, rapids=True, precision=3):
+        """{"cut": [[x0, y0, x1, y1, ...], ...], "rapid": [...]}"""
+        result = {"cut": [], "rapid": []}
+        for kind, xs, ys in self.polylines():
+            if kind == RAPID and not rapids:
+                continue
+            flat = []
+            for x, y in zip(xs, ys):
+                flat.append(round(x, precision))
+                flat.append(round(y, precision))
+            result["cut" if kind == CUT else "rapid"].append(flat)
+        return result
+
+    @property
+    def nbytes(self):
+        return (self.points.itemsize * len(self.points) + self.starts.itemsize * len(self.starts)
+                + len(self.kinds))
+
+
+class GcodeAnalyzer:
+    """
+    Разбор G-code за один проход по кускам (подписчик UploadStream.listeners).
+    Считает габариты, длину реза и холостых ходов, число пробивок и оценку
+    времени; траекторию сразу прореживает с допуском tolerance (мм).
+    """
+
+    def __init__(self, tolerance=None, rapid_speed=None, default_feed=None, pierce_time=None):
+        self.tolerance = tolerance if tolerance is not None else config.GCODE_PREVIEW_TOLERANCE
+        self.rapid_speed = rapid_speed or config.GCODE_RAPID_SPEED
+        self.feed = default_feed or config.GCODE_DEFAULT_FEED
+        self.pierce_time = config.GCODE_PIERCE_TIME if pierce_time is None else pierce_time
+
+        self.max_bytes = config.GCODE_ANALYZE_MAX_BYTES
+        self.hash = hashlib.sha1()
+        self.bytes = 0
+        self.truncated = False
+        self.error = None
+        self.lines = 0
+        self._tail = b""
+
+        # Модальное состояние
+        self.x = self.y = self.z = 0.0
+        self.motion = 0
+        self.absolute = True
+        self.scale = 1.0  # G20 — дюймы
+        self.laser_on = False
+
+        self.min_x = self.min_y = math.inf
+        self.max_x = self.max_y = -math.inf
+        self.cut_length = 0.0
+        self.rapid_length = 0.0
+        self.cut_time = 0.0
+        self.pierces = 0
+        self.laser_commands = 0
+        self.feed_starts = 0  # переходы от холостого хода к резу (если M3/M5 нет)
+
+        self.preview = Preview()
+        self._kind = None
+        self._xs = []
+        self._ys = []
+
+    # --- Поток ---
+    def feed_chunk(self, chunk):
+        """Кусок байтов программы (неполная последняя строка ждёт следующего куска)"""
+        self.hash.update(chunk)
+        self.bytes += len(chunk)
+        if self.error or self.truncated:
+            return
+        if self.bytes > self.max_bytes:
+            # Слишком большая программа: хэш считаем, разбор прекращаем
+            self.truncated = True
+            return
+        data = self._tail + chunk
+        lines = data.split(b"\n")
+        self._tail = lines.pop()
+        try:
+            for line in lines:
+                self.line(line.decode("utf-8", "replace"))
+        except Exception as e:
+            # Ошибка разбора не должна срывать загрузку на станок
+            self.error = str(e)
+
+    __call__ = feed_chunk
+
+    def finish(self):
+        if self._tail and not (self.error or self.truncated):
+            try:
+                self.line(self._tail.decode("utf-8", "replace"))
+            except Exception as e:
+                self.error = str(e)
+        self._tail = b""
+        self._flush()
+        return self.summary()
+
+    # --- Разбор строки ---
+    def line(self, text):
+        self.lines += 1
+        text = COMMENT_RE.sub("", text).upper()
+        if not text.strip():
+            return
+        words = WORD_RE.findall(text)
+        if not words:
+            return
+
+        target = {}
+        for letter, value in words:
+            if letter == "G":
+                code = float(value)
+                if code in (0, 1, 2, 3):
+                    self.motion = int(code)
+                elif code == 90:
+                    self.absolute = True
+                elif code == 91:
+                    self.absolute = False
+                elif code == 20:
+                    self.scale = 25.4
+                elif code == 21:
+                    self.scale = 1.0
+            elif letter == "M":
+                code = int(float(value))
+                if code in config.GCODE_LASER_ON:
+                    self.laser_commands += 1
+                    if not self.laser_on:
+                        self.pierces += 1
+                    self.laser_on = True
+                elif code in config.GCODE_LASER_OFF:
+                    self.laser_on = False
+            elif letter == "F":
+                self.feed = float(value) * self.scale
+            elif letter in "XYZIJR":
+                target[letter] = float(value) * self.scale
+
+        if "X" in target or "Y" in target or "Z" in target:
+            self.move(target)
+
+    def _target(self, target, axis, current):
+        if axis not in target:
+            return current
+        return target[axis] if self.absolute else current + target[axis]
+
+    def move(self, target):
+        x0, y0 = self.x, self.y
+        x1 = self._target(target, "X", x0)
+        y1 = self._target(target, "Y", y0)
+        z1 = self._target(target, "Z", self.z)
+
+        if self.motion in (2, 3) and ("I" in target or "J" in target or "R" in target):
+            xs, ys, length = self.arc(x0, y0, x1, y1, target)
+        else:
+            xs, ys = [x1], [y1]
+            length = math.sqrt((x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - self.z) ** 2)
+
+        kind = RAPID if self.motion == 0 else CUT
+        if kind == RAPID:
+            self.rapid_length += length
+        else:
+            self.cut_length += length
+            if self.feed > 0:
+                self.cut_time += length / self.feed * 60
+        self.x, self.y, self.z = x1, y1, z1
+
+        if (x1, y1) == (x0, y0) and len(xs) == 1:
+            return
+        if kind != self._kind:
+            if kind == CUT and self._kind == RAPID:
+                self.feed_starts += 1
+            self._flush()
+            self._kind = kind
+            self._point(x0, y0)
+        for x, y in zip(xs, ys):
+            self._point(x, y)
+
+    def arc(self, x0, y0, x1, y1, target):
+        """Точки дуги G2/G3 с шагом не грубее допуска и её длина"""
+        if "R" in target:
+            r = abs(target["R"])
+            chord = math.hypot(x1 - x0, y1 - y0)
+            if chord == 0 or chord > 2 * r:
+                return [x1], [y1], chord
+            h = math.sqrt(max(r * r - chord * chord / 4, 0))
+            mx, my = (x0 + x1) / 2, (y0 + y1) / 2
+            sign = 1 if (self.motion == 3) == (target["R"] > 0) else -1
+            cx = mx - sign * h * (y1 - y0) / chord
+            cy = my + sign * h * (x1 - x0) / chord
+        else:
+            cx, cy = x0 + target.get("I", 0.0), y0 + target.get("J", 0.0)
+            r = math.hypot(x0 - cx, y0 - cy)
+
+        start = math.atan2(y0 - cy, x0 - cx)
+        end = math.atan2(y1 - cy, x1 - cx)
+        sweep = end - start
+        if self.motion == 2:  # по часовой
+            if sweep >= 0:
+                sweep -= 2 * math.pi
+        elif sweep <= 0:
+            sweep += 2 * math.pi
+        length = abs(sweep) * r
+
+        # Шаг, при котором хорда отходит от дуги не больше допуска
+        tol = max(self.tolerance, 1e-3)
+        step = 2 * math.acos(max(1 - tol / r, -1)) if r > tol else math.pi / 2
+        segments = max(1, min(int(abs(sweep) / step) + 1, 720))
+        xs, ys = [], []
+        for i in range(1, segments):
+            angle = start + sweep * i / segments
+            xs.append(cx + r * math.cos(angle))
+            ys.append(cy + r * math.sin(angle))
+        xs.append(x1)
+        ys.append(y1)
+        return xs, ys, length
+
+    # --- Траектория ---
+    def _point(self, x, y):
+        self._xs.append(x)
+        self._ys.append(y)
+        # Габариты — по резу: холостые ходы из нуля станка деталь не расширяют
+        if self._kind != CUT:
+            return
+        if x < self.min_x:
+            self.min_x = x
+        if x > self.max_x:
+            self.max_x = x
+        if y < self.min_y:
+            self.min_y = y
+        if y > self.max_y:
+            self.max_y = y
+
+    def _flush(self):
+        """Закрытая полилиния прореживается и уходит в preview"""
+        if len(self._xs) >= 2:
+            keep = simplify(self._xs, self._ys, self.tolerance)
+            self.preview.add(self._kind, [self._xs[i] for i in keep], [self._ys[i] for i in keep])
+        self._xs = []
+        self._ys = []
+        self._kind = None
+
+    def summary(self):
+        pierces = self.pierces if self.laser_commands else self.feed_starts
+        rapid_time = self.rapid_length / self.rapid_speed * 60
+        has_bbox = self.min_x <= self.max_x
+        return {
+            "hash": self.hash.hexdigest(),
+            "bytes": self.bytes,
+            "lines": self.lines,
+            "bbox": {
+                "min_x": round(self.min_x, 3), "min_y": round(self.min_y, 3),
+                "max_x": round(self.max_x, 3), "max_y": round(self.max_y, 3),
+                "width": round(self.max_x - self.min_x, 3), "height": round(self.max_y - self.min_y, 3),
+            } if has_bbox else None,
+            "cut_length": round(self.cut_length, 3),
+            "rapid_length": round(self.rapid_length, 3),
+            "pierces": pierces,
+            "estimated_time": round(self.cut_time + rapid_time + pierces * self.pierce_time, 1),
+            "preview_points": len(self.preview),
+            "complete": not (self.truncated or self.error),
+            "error": self.error,
+        }
+
+
+def analyze_text(text, tolerance=None, chunk_size=None):
+    """
+    Разбор программы целиком (например, listing, загруженный не через этот сервер).
+    Текст разбирается кусками, между ними sleep(0) отдаёт управление
+    другим green-потокам eventlet, чтобы разбор не останавливал сервер
+    """
+    analyzer = GcodeAnalyzer(tolerance)
+    data = text.encode("utf-8")
+    step = chunk_size or config.GCODE_ANALYZE_CHUNK
+    for start in range(0, len(data), step):
+        analyzer.feed_chunk(data[start:start + step])
+        time.sleep(0)
+    analyzer.finish()
+    return analyzer
@@ -0,0 +1,76 @@
+"""Минимальный JSON Patch (RFC 6902): операции add / remove / replace"""
+
+
+def _escape(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token):
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff(src, dst, path=""):
+    """Список операций, превращающих src в dst"""
+    if type(src) is not type(dst):
+        return [{"op": "replace", "path": path, "value": dst}]
+
+    if isinstance(src, dict):
+        ops = []
+        for key, value in src.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in dst:
+                ops.append({"op": "remove", "path": child})
+            else:
+                ops.extend(diff(value, dst[key], child))
+        for key, value in dst.items():
+            if key not in src:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+        return ops
+
+    if isinstance(src, list):
+        # Списки одной длины сравниваем поэлементно, иначе заменяем целиком
+        if len(src) != len(dst):
+            return [{"op": "replace", "path": path, "value": dst}]
+        ops = []
+        for i, (a, b) in enumerate(zip(src, dst)):
+            ops.extend(diff(a, b, f"{path}/{i}"))
+        return ops
+
+    if src != dst:
+        return [{"op": "replace", "path": path, "value": dst}]
+    return []
+
+
+def _parent(doc, path):
+    tokens = [_unescape(t) for t in path.split("/")[1:]]
+    target = doc
+    for token in tokens[:-1]:
+        target = target[int(token)] if isinstance(target, list) else target[token]
+    last = tokens[-1]
+    return target, int(last) if isinstance(target, list) and last != "-" else last
+
+
+def apply(doc, ops):
+    """Применяет операции к doc (изменяя его) и возвращает результат"""
+    for op in ops:
+        path = op["path"]
+        if path == "":
+            if op["op"] == "remove":
+                doc = None
+            else:
+                doc = op["value"]
+            continue
+
+        target, key = _parent(doc, path)
+        if op["op"] == "remove":
+            del target[key]
+        elif op["op"] == "add" and isinstance(target, list):
+            if key == "-":
+                target.append(op["value"])
+            else:
+                target.insert(key, op["value"])
+        elif op["op"] in ("add", "replace"):
+            target[key] = op["value"]
+        else:
+            raise ValueError(f"Unsupported patch op: {op['op']}")
+    return doc
@@ -0,0 +1,96 @@
+import time
+import hashlib
+import threading
+from array import array
+from collections import namedtuple
+import config
+
+
+class Listing(namedtuple("Listing", "text offsets etag")):
+    """Снимок listing: текст, смещения начала строк и ETag"""
+
+    @property
+    def line_count(self):
+        return len(self.offsets)
+
+    def lines(self, start=None, end=None):
+        """Строки [start, end) (нумерация с 0) одним срезом текста"""
+        count = self.line_count
+        start = 0 if start is None else max(0, min(start, count))
+        end = count if end is None else max(start, min(end, count))
+        if start >= end:
+            return "", start, end
+        stop = self.offsets[end] if end < count else len(self.text)
+        return self.text[self.offsets[start]:stop], start, end
+
+
+def index_lines(text):
+    """Смещения начала каждой строки"""
+    offsets = array("L")
+    if not text:
+        return offsets
+    offsets.append(0)
+    pos = text.find("\n")
+    while pos != -1 and pos + 1 < len(text):
+        offsets.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    return offsets
+
+
+class ListingCache:
+    """
+    Кэш G-code listing загруженной программы.
+    Индекс строк строится один раз на программу, поэтому диапазон строк
+    отдаётся срезом без повторного скачивания и разбора.
+    """
+
+    def __init__(self, fetch, ttl=None):
+        self.fetch = fetch  # fetch() -> текст listing с контроллера
+        self.ttl = ttl if ttl is not None else config.LISTING_CACHE_TTL
+        self.program_key = None
+        self.current = None
+        self.fetched_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self.fetched_at = 0.0
+            self.current = None
+
+    def note_program(self, key):
+        """Сбрасывает кэш, если loadresult показывает другую программу; True — программа сменилась"""
+        if key == self.program_key:
+            return False
+        self.program_key = key
+        self.invalidate()
+        return True
+
+    def _stale(self):
+        if self.current is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self.fetched_at > self.ttl
+
+    def get(self):
+        """
+        Актуальный Listing; при необходимости запрос к контроллеру.
+        Одновременные промахи объединяет fetch (single-flight в routes).
+        """
+        if not self._stale():
+            return self.current
+
+        generation = self._generation
+        text = self.fetch()
+        etag = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            # Та же программа после TTL — индекс не перестраиваем
+            if self.current is not None and self.current.etag == etag:
+                listing = self.current
+            else:
+                listing = Listing(text, index_lines(text), etag)
+            # Программу сменили, пока шёл запрос, — ответ в кэш не кладём
+            if generation == self._generation:
+                self.current = listing
+                self.fetched_at = time.monotonic()
+            return listing
@@ -0,0 +1,177 @@
+import config
+from api.controller import ControllerClient, controller as default_controller
+from api.listing import ListingCache
+from api.proxy_cache import ProxyCache, proxy_cache as default_proxy_cache
+from api.singleflight import SingleFlight
+from telemetry import TelemetryHistory, telemetry_history as default_history
+
+
+class Machine:
+    """
+    Один станок за шлюзом: свой клиент контроллера (пул соединений и предохранитель),
+    объединение запросов, кэши listing и настроек по gcore, история телеметрии.
+    TelemetryHub создаёт app.py — ему нужен socketio.
+    """
+
+    def __init__(self, machine_id, url, name=None, gcores=None, namespace=None,
+                 controller=None, proxy_cache=None, history=None):
+        self.id = machine_id
+        self.name = name or machine_id
+        self.url = url
+        self.gcores = list(gcores or [0])
+        # gcores не заданы в конфиге — номер gcore из запроса не проверяется
+        self.any_core = not gcores
+        self.namespace = namespace or f"/m/{machine_id}"
+
+        self.controller = controller or ControllerClient(url, name=machine_id)
+        self.singleflight = SingleFlight()
+        self.proxy_cache = proxy_cache or ProxyCache()
+        self.history = history or TelemetryHistory()
+        self.telemetry = None
+
+        self.listings = {}       # core -> ListingCache
+        self.core_programs = {}  # core -> хэш программы, загруженной через этот сервер
+        # gcore, куда загрузили программу, а loadresult её ещё не видел
+        self.pending_uploads = set()
+
+    @property
+    def default_core(self):
+        return self.gcores[0]
+
+    def listing_cache(self, core):
+        cache = self.listings.get(core)
+        if cache is None:
+            cache = self.listings.setdefault(core, ListingCache(
+                lambda: self.singleflight.do(f"listing:{core}", lambda: self.fetch_listing(core))))
+        return cache
+
+    # --- Программы ---
+    def note_upload(self, core, program_hash):
+        """Программа загружена через этот сервер: её разбор — превью gcore"""
+        cache = self.listing_cache(core)
+        cache.invalidate()
+        # Следующий loadresult — уже эта программа, даже если имя то же
+        cache.program_key = None
+        self.core_programs[core] = program_hash
+        self.pending_uploads.add(core)
+
+    def note_program(self, core, key):
+        """
+        Ответ loadresult. Новая программа сбрасывает listing, а если её загрузили
+        не через этот сервер (с пульта станка, другим шлюзом) — и превью
+        """
+        if not self.listing_cache(core).note_program(key):
+            return
+        if core in self.pending_uploads:
+            self.pending_uploads.discard(core)
+        else:
+            self.core_programs.pop(core, None)
+
+    # --- Запросы к контроллеру ---
+    def fetch_load_result(self, core):
+        resp = self.controller.get("loadresult", f"/py/gcores[{core}].loadresult")
+        resp.raise_for_status()
+        return resp.text.strip()
+
+    def fetch_listing(self, core):
+        resp = self.controller.get("listing", f"/gcore/{core}/listing")
+        resp.raise_for_status()
+        return resp.text
+
+    def fetch_cut_settings(self, core):
+        resp = self.controller.get("cut_settings", "/cut_settings/settings", params={"gcore": core})
+        resp.raise_for_status()
+        return resp.json()
+
+    def fetch_cut_settings_schema(self, core):
+        resp = self.controller.get("cut_settings_schema", "/cut_settings/schema", params={"gcore": core})
+        resp.raise_for_status()
+        return resp.json()  # JSON от внешнего сервера
+
+    # --- Телеметрия ---
+    def telemetry_resources(self):
+        """config.TELEMETRY_RESOURCES, пути с {gcore} — по ресурсу на каждый gcore станка"""
+        resources = {}
+        for name, path in config.TELEMETRY_RESOURCES.items():
+            if "{gcore}" not in path:
+                resources[name] = path
+                continue
+            for core in self.gcores:
+                resources[f"{name}:{core}"] = path.format(gcore=core)
+        return resources
+
+    def telemetry_channels(self):
+        """config.TELEMETRY_CHANNELS, каналы ресурсов с {gcore} — по каналу на каждый gcore"""
+        channels = {}
+        for name, spec in config.TELEMETRY_CHANNELS.items():
+            resource = spec["resource"]
+            if "{gcore}" not in config.TELEMETRY_RESOURCES[resource]:
+                channels[name] = spec
+                continue
+            channels[name] = dict(spec, resource=f"{resource}:{self.default_core}")
+            for core in self.gcores:
+                channels[f"{name}:{core}"] = dict(spec, resource=f"{resource}:{core}",
+                                                  event=f"{spec.get('event', f'telemetry.{name}')}:{core}")
+        return channels
+
+    def fetch_telemetry(self, resource, path):
+        """
+        Ресурс телеметрии с контроллера. Ошибка уходит в TelemetryHub.poll:
+        кадр и запись в историю пропускаются, о недоступности клиентам
+        сообщает событие controller_health
+        """
+        # "<ресурс>:1" — таймауты и статистика общие для ресурса
+        resp = self.controller.get(resource.partition(":")[0], path)
+        resp.raise_for_status()
+        return resp.json()
+
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "url": self.url,
+            "gcores": self.gcores,
+            "any_core": self.any_core,
+            "namespace": self.namespace,
+            "health": self.controller.breaker.status(),
+        }
+
+
+class MachineRegistry:
+    """Станки из config.MACHINES; get(None) — станок по умолчанию"""
+
+    def __init__(self, machines=None, default_id=None):
+        self.default_id = default_id or config.DEFAULT_MACHINE
+        self._machines = {}
+        for machine_id, spec in (machines or config.MACHINES).items():
+            options = {}
+            if machine_id == self.default_id:
+                # Прежние однопоточные объекты становятся объектами станка по умолчанию,
+                # а его клиенты остаются в namespace "/"
+                options["namespace"] = "/"
+                options["proxy_cache"] = default_proxy_cache
+                options["history"] = default_history
+                if default_controller.base_url == spec["url"].rstrip("/"):
+                    options["controller"] = default_controller
+            self._machines[machine_id] = Machine(
+                machine_id, spec["url"], name=spec.get("name"), gcores=spec.get("gcores"), **options)
+        if self.default_id not in self._machines:
+            raise ValueError(f"DEFAULT_MACHINE '{self.default_id}' is not in MACHINES")
+
+    @property
+    def default(self):
+        return self._machines[self.default_id]
+
+    def get(self, machine_id=None):
+        if machine_id is None:
+            return self.default
+        return self._machines.get(machine_id)
+
+    def __iter__(self):
+        return iter(self._machines.values())
+
+    def __len__(self):
+        return len(self._machines)
+
+
+machines = MachineRegistry()
@@ -0,0 +1,293 @@
+import json
+import zlib
+import sys
+import hashlib
+from api import jsonpatch
+
+
+# Хранение содержимого пресетов:
+#   preset_blobs     — сжатый JSON, ключ — sha256 содержимого (копии делят один blob)
+#   preset_revisions — история: для каждой прошлой версии обратный JSON Patch
+#                      (следующая версия -> эта), полная копия есть только у текущей
+COMPRESS_LEVEL = 6
+
+
+def init_schema(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS preset_blobs (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS preset_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        preset_id INTEGER NOT NULL,
+        rev INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        code TEXT NOT NULL,
+        thickness REAL NOT NULL,
+        hash TEXT NOT NULL,
+        patch BLOB NOT NULL,
+        ts DATETIME,
+        UNIQUE (preset_id, rev)
+    )
+    """)
+
+    columns = [row[1] for row in c.execute("PRAGMA table_info(presets)").fetchall()]
+    if "blob_hash" not in columns:
+        c.execute("ALTER TABLE presets ADD COLUMN blob_hash TEXT")
+    if "rev" not in columns:
+        c.execute("ALTER TABLE presets ADD COLUMN rev INTEGER DEFAULT 1")
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS preset_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """)
+    global keep_legacy_json
+    keep_legacy_json = get_meta(c, "legacy_json", "kept") == "kept"
+
+    # Старые строки с JSON в колонке preset переносим в blob-хранилище;
+    # сама колонка остаётся заполненной, пока её не очистит drop_legacy_json()
+    rows = c.execute("SELECT id, preset FROM presets WHERE blob_hash IS NULL").fetchall()
+    if rows:
+        print(f"🛠️  Миграция базы: переносим {len(rows)} пресетов в сжатое хранилище...")
+        for preset_id, preset_json in rows:
+            blob_hash = put_blob(c, json.loads(preset_json))
+            c.execute("UPDATE presets SET blob_hash=? WHERE id=?", (blob_hash, preset_id))
+        print("✅ Пресеты перенесены")
+
+    if keep_legacy_json:
+        synced = sync_legacy_rows(c)
+        if synced:
+            print(f"🛠️  {synced} пресетов изменены прежней версией сервера — сохранены новыми ревизиями")
+
+
+# Пока True, JSON пресета дублируется в старую колонку presets.preset, чтобы
+# можно было откатиться на версию без preset_blobs. Выключается один раз
+# командой `python -m api.preset_store drop-legacy-json` (состояние — в preset_meta)
+keep_legacy_json = True
+
+
+def get_meta(c, key, default=None):
+    row = c.execute("SELECT value FROM preset_meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def sync_legacy_rows(c):
+    """
+    Строки, которые прежняя версия сервера изменила после отката: JSON в колонке
+    preset уже не совпадает с blob. Содержимое из preset становится текущим,
+    прежний blob уходит в историю ревизией. Возвращает число таких строк.
+    """
+    rows = c.execute("""
+        SELECT id, name, code, thickness, preset, blob_hash, rev, ts
+        FROM presets WHERE preset!='' AND blob_hash IS NOT NULL
+    """).fetchall()
+    synced = 0
+    for preset_id, name, code, thickness, preset_json, old_hash, rev, ts in rows:
+        data = json.loads(preset_json)
+        if content_hash(data) == old_hash:
+            continue
+        rev = rev or 1
+        new_hash = put_blob(c, data)
+        # Имя и толщина прежней версии неизвестны — ревизия хранит текущие
+        add_revision(c, preset_id, rev, name, code, thickness, old_hash, data, ts)
+        c.execute("UPDATE presets SET blob_hash=?, rev=? WHERE id=?", (new_hash, rev + 1, preset_id))
+        drop_blob_if_unused(c, old_hash)
+        synced += 1
+    return synced
+
+
+def drop_legacy_json(c):
+    """
+    Очистка старой колонки presets.preset (после неё откат на версию без
+    preset_blobs невозможен). Возвращает число очищенных строк.
+    """
+    global keep_legacy_json
+    begin_write(c)
+    sync_legacy_rows(c)
+    cur = c.execute("UPDATE presets SET preset='' WHERE preset!=''")
+    c.execute("INSERT OR REPLACE INTO preset_meta (key, value) VALUES ('legacy_json', 'dropped')")
+    keep_legacy_json = False
+    return cur.rowcount
+
+
+# --- Blob ---
+def dump(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def legacy_json(data):
+    """Текст для старой колонки presets.preset ('' — колонка больше не нужна)"""
+    return json.dumps(data, ensure_ascii=False) if keep_legacy_json else ""
+
+
+def begin_write(c):
+    """
+    BEGIN IMMEDIATE, если транзакция ещё не начата: чтение перед записью
+    идёт уже под блокировкой записи, параллельные сохранения не считают одну ревизию
+    """
+    conn = getattr(c, "connection", c)
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+def content_hash(data):
+    return hashlib.sha256(dump(data).encode("utf-8")).hexdigest()
+
+
+def put_blob(c, data):
+    """Сохраняет содержимое (если такого ещё нет) и возвращает его hash"""
+    raw = dump(data).encode("utf-8")
+    blob_hash = hashlib.sha256(raw).hexdigest()
+    c.execute("INSERT OR IGNORE INTO preset_blobs (hash, data, size) VALUES (?, ?, ?)",
+              (blob_hash, zlib.compress(raw, COMPRESS_LEVEL), len(raw)))
+    return blob_hash
+
+
+def load_text(data):
+    """Сжатый blob -> JSON-текст пресета"""
+    return zlib.decompress(data).decode("utf-8")
+
+
+def get_blob(c, blob_hash):
+    row = c.execute("SELECT data FROM preset_blobs WHERE hash=?", (blob_hash,)).fetchone()
+    return json.loads(load_text(row[0]))
+
+
+def drop_blob_if_unused(c, blob_hash):
+    c.execute("""
+        DELETE FROM preset_blobs
+        WHERE hash=? AND NOT EXISTS (SELECT 1 FROM presets WHERE blob_hash=?)
+    """, (blob_hash, blob_hash))
+
+
+# --- Пресеты ---
+def insert_preset(c, name, code, thickness, data, ts):
+    blob_hash = put_blob(c, data)
+    cur = c.execute("""
+        INSERT INTO presets (name, code, thickness, preset, blob_hash, rev, status, ts)
+        VALUES (?, ?, ?, ?, ?, 1, 'active', ?)
+    """, (name, code, thickness, legacy_json(data), blob_hash, ts))
+    return cur.lastrowid
+
+
+def copy_preset(c, preset_id, ts):
+    """Копия активного пресета: новая строка ссылается на тот же blob"""
+    row = c.execute("""
+        SELECT name, code, thickness, preset, blob_hash
+        FROM presets WHERE id=? AND status='active'
+    """, (preset_id,)).fetchone()
+    if not row:
+        return None, None
+    name, code, thickness, preset_json, blob_hash = row
+    cur = c.execute("""
+        INSERT INTO presets (name, code, thickness, preset, blob_hash, rev, status, ts)
+        VALUES (?, ?, ?, ?, ?, 1, 'active', ?)
+    """, (name, code, thickness, preset_json, blob_hash, ts))
+    return cur.lastrowid, name
+
+
+def update_preset(c, preset_id, name, code, thickness, data, ts):
+    """
+    Новая версия активного пресета. Прошлая версия уходит в историю
+    обратным патчем. False — пресет не найден или удалён.
+    Повторное сохранение того же содержимого ревизию не создаёт.
+    """
+    begin_write(c)
+    row = c.execute("""
+        SELECT name, code, thickness, blob_hash, rev, ts
+        FROM presets WHERE id=? AND status='active'
+    """, (preset_id,)).fetchone()
+    if not row:
+        return False
+    old_name, old_code, old_thickness, old_hash, old_rev, old_ts = row
+    old_rev = old_rev or 1
+
+    new_hash = put_blob(c, data)
+    if new_hash == old_hash and (name, code, thickness) == (old_name, old_code, old_thickness):
+        return True
+    add_revision(c, preset_id, old_rev, old_name, old_code, old_thickness, old_hash, data, old_ts)
+    c.execute("""
+        UPDATE presets
+        SET name=?, code=?, thickness=?, preset=?, blob_hash=?, rev=?, ts=?
+        WHERE id=?
+    """, (name, code, thickness, legacy_json(data), new_hash, old_rev + 1, ts, preset_id))
+
+    if new_hash != old_hash:
+        drop_blob_if_unused(c, old_hash)
+    return True
+
+
+def add_revision(c, preset_id, rev, name, code, thickness, blob_hash, next_data, ts):
+    """Ревизия rev (содержимое blob_hash) — обратный патч от следующей версии next_data"""
+    patch = jsonpatch.diff(next_data, get_blob(c, blob_hash))
+    c.execute("""
+        INSERT INTO preset_revisions (preset_id, rev, name, code, thickness, hash, patch, ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (preset_id, rev, name, code, thickness, blob_hash,
+          zlib.compress(dump(patch).encode("utf-8"), COMPRESS_LEVEL), ts))
+
+
+def delete_all(c):
+    c.execute("DELETE FROM presets")
+    c.execute("DELETE FROM preset_blobs")
+    c.execute("DELETE FROM preset_revisions")
+
+
+# --- История ---
+def list_revisions(c, preset_id):
+    """(текущая ревизия, список прошлых) или (None, None)"""
+    current = c.execute("SELECT rev, ts, blob_hash FROM presets WHERE id=?", (preset_id,)).fetchone()
+    if not current:
+        return None, None
+    rows = c.execute("""
+        SELECT rev, ts, hash, length(patch) FROM preset_revisions
+        WHERE preset_id=? ORDER BY rev DESC
+    """, (preset_id,)).fetchall()
+    revisions = [{"rev": r[0], "ts": r[1], "hash": r[2], "patch_bytes": r[3]} for r in rows]
+    return {"rev": current[0] or 1, "ts": current[1], "hash": current[2]}, revisions
+
+
+def get_revision(c, preset_id, rev):
+    """Содержимое ревизии rev: текущая версия с обратными патчами до rev"""
+    current = c.execute("""
+        SELECT name, code, thickness, blob_hash, rev, ts FROM presets WHERE id=?
+    """, (preset_id,)).fetchone()
+    if not current:
+        return None
+    name, code, thickness, blob_hash, current_rev, ts = current
+    current_rev = current_rev or 1
+    if rev > current_rev or rev < 1:
+        return None
+
+    data = get_blob(c, blob_hash)
+    if rev < current_rev:
+        rows = c.execute("""
+            SELECT rev, name, code, thickness, patch, ts FROM preset_revisions
+            WHERE preset_id=? AND rev>=? AND rev<? ORDER BY rev DESC
+        """, (preset_id, rev, current_rev)).fetchall()
+        if not rows or rows[-1][0] != rev:
+            return None
+        for _, name, code, thickness, patch, ts in rows:
+            data = jsonpatch.apply(data, json.loads(load_text(patch)))
+
+    return {"rev": rev, "name": name, "code": code, "thickness": thickness, "preset": data, "ts": ts}
+
+
+if __name__ == "__main__":
+    # python -m api.preset_store drop-legacy-json — очистить presets.preset и сжать файл базы
+    if sys.argv[1:] != ["drop-legacy-json"]:
+        raise SystemExit("usage: python -m api.preset_store drop-legacy-json")
+    from api import db
+    conn = db.open_connection()
+    init_schema(conn)
+    cleared = drop_legacy_json(conn)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ Старая колонка preset очищена у {cleared} пресетов, откат на версию без preset_blobs больше невозможен")
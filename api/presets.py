@@ -1,66 +1,239 @@
-from flask import Blueprint, request, jsonify
-import sqlite3, json, datetime, os
+from flask import Blueprint, request, jsonify, Response
+import json, datetime, base64, sqlite3
+import config
+from api import db, preset_store
+from api.lru import LRUCache
 
-DB_PATH = "preset.db"
 preset_bp = Blueprint("db", __name__)
 
+# Разобранные пресеты по id для /db/get_preset
+preset_cache = LRUCache(config.PRESET_CACHE_ENTRIES, config.PRESET_CACHE_BYTES)
+
 
 # --- Инициализация и миграция базы ---
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS presets (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        code TEXT NOT NULL,
-        thickness REAL NOT NULL,
-        preset TEXT NOT NULL,
-        status TEXT DEFAULT 'active',
-        ts DATETIME DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    conn.commit()
-
-    # --- Проверка, есть ли поле status ---
-    c.execute("PRAGMA table_info(presets)")
-    columns = [row[1] for row in c.fetchall()]
-    if "status" not in columns:
-        print("🛠️  Миграция базы: добавляем поле 'status'...")
-        c.execute("ALTER TABLE presets ADD COLUMN status TEXT DEFAULT 'active'")
+    with db.connect() as conn:
+        c = conn.cursor()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS presets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            code TEXT NOT NULL,
+            thickness REAL NOT NULL,
+            preset TEXT NOT NULL,
+            status TEXT DEFAULT 'active',
+            ts DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
         conn.commit()
-        print("✅ Поле 'status' добавлено успешно")
 
-    conn.close()
+        # --- Проверка, есть ли поле status ---
+        c.execute("PRAGMA table_info(presets)")
+        columns = [row[1] for row in c.fetchall()]
+        if "status" not in columns:
+            print("🛠️  Миграция базы: добавляем поле 'status'...")
+            c.execute("ALTER TABLE presets ADD COLUMN status TEXT DEFAULT 'active'")
+            conn.commit()
+            print("✅ Поле 'status' добавлено успешно")
+
+        # --- Индексы: поиск по материалу/толщине и список по времени ---
+        c.execute("CREATE INDEX IF NOT EXISTS idx_presets_status_code_thickness ON presets(status, code, thickness)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_presets_status_ts ON presets(status, ts)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_presets_ts ON presets(ts)")
+
+        # --- Сжатое хранилище содержимого и история ревизий ---
+        preset_store.init_schema(c)
 
 
 init_db()
 
 
 # --- Вспомогательные функции ---
+def db_busy(e, **extra):
+    """503: все соединения с базой заняты (например, медленными выгрузками)"""
+    return jsonify({"status": "error", "msg": str(e), **extra}), 503
+
+
 def list_presets(include_all=False):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    if include_all:
-        c.execute("SELECT id, name, code, thickness, status, ts FROM presets ORDER BY ts DESC")
-    else:
-        c.execute("SELECT id, name, code, thickness, status, ts FROM presets WHERE status='active' ORDER BY ts DESC")
-    rows = c.fetchall()
-    conn.close()
+    with db.connect() as conn:
+        c = conn.cursor()
+        if include_all:
+            c.execute("SELECT id, name, code, thickness, status, ts FROM presets ORDER BY ts DESC")
+        else:
+            c.execute("SELECT id, name, code, thickness, status, ts FROM presets WHERE status='active' ORDER BY ts DESC")
+        rows = c.fetchall()
     return [
         {"id": r[0], "name": r[1], "code": r[2], "thickness": r[3], "status": r[4], "ts": r[5]}
         for r in rows
     ]
 
 
+# Поля, которые можно запросить в /db/listpresets?fields=
+LIST_FIELDS = ("id", "name", "code", "thickness", "status", "ts")
+
+
+def like_substring(text):
+    """Шаблон LIKE для поиска подстроки, % и _ экранируются"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def parse_id(value):
+    """
+    id пресета из запроса как int — ключ preset_cache ("05" и " 5" — тот же пресет 5).
+    None, если id нет или это не число
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(ts, preset_id):
+    return base64.urlsafe_b64encode(f"{ts}|{preset_id}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    ts, preset_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+    return ts, int(preset_id)
+
+
+def list_presets_page(include_all=False, limit=None, cursor=None, fields=None, name=None):
+    """
+    Страница списка пресетов (новые первыми), keyset по (ts, id).
+    Возвращает (rows, fields, next_cursor); rows — кортежи значений fields.
+    """
+    fields = list(fields or LIST_FIELDS)
+    limit = max(1, min(limit or config.PRESETS_PAGE_SIZE, config.PRESETS_PAGE_MAX))
+
+    # ts и id нужны для курсора, даже если не запрошены
+    columns = fields + [f for f in ("ts", "id") if f not in fields]
+    query = f"SELECT {', '.join(columns)} FROM presets"
+    where, params = [], []
+    if not include_all:
+        where.append("status='active'")
+    if cursor:
+        ts, preset_id = decode_cursor(cursor)
+        # Сравнение строк-значений: план (status=? AND ts<?) по индексу, а не перебор с начала
+        where.append("(ts, id) < (?, ?)")
+        params += [ts, preset_id]
+    if name:
+        where.append("name LIKE ? ESCAPE '\\'")
+        params.append(like_substring(name))
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY ts DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with db.connect() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(columns, rows[-1]))
+        next_cursor = encode_cursor(last["ts"], last["id"])
+    return [r[:len(fields)] for r in rows], fields, next_cursor
+
+
+def row_to_preset(row):
+    """Строка (id, name, code, thickness, blob, ts, status) -> словарь пресета"""
+    return {
+        "id": row[0],
+        "name": row[1],
+        "code": row[2],
+        "thickness": row[3],
+        "preset": json.loads(preset_store.load_text(row[4])),
+        "ts": row[5],
+        "status": row[6],
+    }
+
+
+def find_preset(code, thickness=None, thickness_min=None, thickness_max=None, nearest=True):
+    """
+    Активный пресет материала code одним запросом по индексу (status, code, thickness).
+    Сначала точная толщина / диапазон, затем (если nearest) ближайшая по толщине,
+    при равенстве — самый свежий. Возвращает (row, match) или (None, None).
+    """
+    if thickness is None and thickness_min is None and thickness_max is None:
+        raise ValueError("thickness or thickness_min/thickness_max required")
+    low = thickness_min if thickness_min is not None else (thickness if thickness is not None else float("-inf"))
+    high = thickness_max if thickness_max is not None else (thickness if thickness is not None else float("inf"))
+    if thickness is not None:
+        target = thickness
+    elif thickness_min is not None and thickness_max is not None:
+        target = (thickness_min + thickness_max) / 2
+    else:
+        target = low if thickness_min is not None else high
+
+    query = """
+        SELECT p.id, p.name, p.code, p.thickness, b.data, p.ts, p.status,
+               p.thickness BETWEEN ? AND ? AS in_range
+        FROM presets p JOIN preset_blobs b ON b.hash = p.blob_hash
+        WHERE p.status='active' AND p.code=?
+    """
+    params = [low, high, code]
+    if not nearest:
+        query += " AND p.thickness BETWEEN ? AND ?"
+        params += [low, high]
+    query += " ORDER BY in_range DESC, ABS(p.thickness - ?), p.ts DESC LIMIT 1"
+    params.append(target)
+
+    with db.connect() as conn:
+        row = conn.execute(query, params).fetchone()
+    if not row:
+        return None, None
+
+    if not row[7]:
+        match = "nearest"
+    elif thickness is not None and row[3] == thickness:
+        match = "exact"
+    else:
+        match = "range"
+    return row[:7], match
+
+
 # --- API Routes ---
 
 @preset_bp.route("/listpresets", methods=["GET"])
 def api_list_presets():
+    """
+    Список пресетов. Без параметров страницы — весь список массивом (как раньше).
+    limit, cursor — постраничная выдача, ответ {"items": [...], "next_cursor": ...}
+    fields=id,name,... — только нужные поля; name=... — поиск по подстроке имени
+    compact=true — {"fields": [...], "rows": [[...]], "next_cursor": ...}
+    """
     try:
         include_all = request.args.get("all", "false").lower() == "true"
-        presets = list_presets(include_all)
-        return jsonify(presets), 200
+        args = request.args
+        if not any(k in args for k in ("limit", "cursor", "fields", "name", "compact")):
+            presets = list_presets(include_all)
+            return jsonify(presets), 200
+
+        fields = None
+        if args.get("fields"):
+            fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+            unknown = [f for f in fields if f not in LIST_FIELDS]
+            if unknown:
+                return jsonify({"status": "error", "msg": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+        try:
+            rows, fields, next_cursor = list_presets_page(
+                include_all,
+                limit=args.get("limit", type=int),
+                cursor=args.get("cursor"),
+                fields=fields,
+                name=args.get("name"),
+            )
+        except ValueError:
+            return jsonify({"status": "error", "msg": "Invalid cursor"}), 400
+
+        if args.get("compact", "false").lower() == "true":
+            return jsonify({"fields": fields, "rows": [list(r) for r in rows], "next_cursor": next_cursor}), 200
+        items = [dict(zip(fields, r)) for r in rows]
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
 
@@ -74,15 +247,8 @@ def api_save_preset():
         thickness = data["material"]["thickness"]
         name = data.get("name") or f"{code}_{thickness}"
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO presets (name, code, thickness, preset, status, ts)
-            VALUES (?, ?, ?, ?, 'active', ?)
-        """, (name, code, thickness, json.dumps(data), datetime.datetime.utcnow()))
-        conn.commit()
-        preset_id = c.lastrowid
-        conn.close()
+        with db.connect() as conn:
+            preset_id = preset_store.insert_preset(conn, name, code, thickness, data, datetime.datetime.utcnow())
 
         return jsonify({"success": True, "id": preset_id, "name": name}), 201
     except Exception as e:
@@ -94,29 +260,24 @@ def api_update_preset():
     """Обновить существующий пресет"""
     try:
         data = request.get_json(force=True)
-        preset_id = data.get("id")
+        preset_id = parse_id(data.get("id"))
         if not preset_id:
             return jsonify({"status": "error", "msg": "id required"}), 400
 
         code = data["material"]["name"]
         thickness = data["material"]["thickness"]
         name = data.get("name") or f"{code}_{thickness}"
-        preset_json = json.dumps(data)
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            UPDATE presets 
-            SET name=?, code=?, thickness=?, preset=?, ts=? 
-            WHERE id=? AND status='active'
-        """, (name, code, thickness, preset_json, datetime.datetime.utcnow(), preset_id))
-        conn.commit()
-        updated = c.rowcount
-        conn.close()
+        with db.connect() as conn:
+            updated = preset_store.update_preset(conn, preset_id, name, code, thickness, data,
+                                                 datetime.datetime.utcnow())
+        preset_cache.invalidate(preset_id)
 
-        if updated == 0:
+        if not updated:
             return jsonify({"status": "error", "msg": "Preset not found or deleted"}), 404
         return jsonify({"status": "ok", "msg": f"Preset {preset_id} updated"}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
 
@@ -124,24 +285,25 @@ def api_update_preset():
 @preset_bp.route("/deletepreset", methods=["DELETE"])
 def api_delete_preset():
     """Мягкое удаление — меняем статус на deleted"""
-    preset_id = request.args.get("id")
+    preset_id = parse_id(request.args.get("id"))
     if not preset_id:
         return jsonify({"status": "error", "msg": "id required"}), 400
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            UPDATE presets 
-            SET status='deleted', ts=? 
-            WHERE id=? AND status='active'
-        """, (datetime.datetime.utcnow(), preset_id))
-        conn.commit()
-        updated = c.rowcount
-        conn.close()
+        with db.connect() as conn:
+            c = conn.cursor()
+            c.execute("""
+                UPDATE presets 
+                SET status='deleted', ts=? 
+                WHERE id=? AND status='active'
+            """, (datetime.datetime.utcnow(), preset_id))
+            updated = c.rowcount
+        preset_cache.invalidate(preset_id)
 
         if updated == 0:
             return jsonify({"status": "error", "msg": "Preset not found or already deleted"}), 404
         return jsonify({"status": "ok", "msg": f"Preset {preset_id} marked as deleted"}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
 
@@ -155,30 +317,17 @@ def api_copy_preset():
         if not preset_id:
             return jsonify({"status": "error", "msg": "id required"}), 400
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            SELECT name, code, thickness, preset 
-            FROM presets WHERE id=? AND status='active'
-        """, (preset_id,))
-        row = c.fetchone()
-        if not row:
-            conn.close()
+        # Копия ссылается на тот же blob — содержимое не дублируется
+        with db.connect() as conn:
+            new_id, new_name = preset_store.copy_preset(conn, preset_id, datetime.datetime.utcnow())
+        if new_id is None:
             return jsonify({"status": "error", "msg": "Preset not found or deleted"}), 404
-
-        old_name, code, thickness, preset_json = row
-        new_name = f"{old_name}"
-
-        c.execute("""
-            INSERT INTO presets (name, code, thickness, preset, status, ts)
-            VALUES (?, ?, ?, ?, 'active', ?)
-        """, (new_name, code, thickness, preset_json, datetime.datetime.utcnow()))
-        conn.commit()
-        new_id = c.lastrowid
-        conn.close()
+        preset_cache.invalidate(new_id)
 
         return jsonify({"status": "ok", "msg": f"Preset copied as {new_name}", "id": new_id}), 201
 
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
 
@@ -187,12 +336,12 @@ def api_copy_preset():
 def api_delete_all_presets():
     """Полное удаление всех пресетов"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("DELETE FROM presets")
-        conn.commit()
-        conn.close()
+        with db.connect() as conn:
+            preset_store.delete_all(conn)
+        preset_cache.clear()
         return jsonify({"status": "ok", "msg": "All presets deleted"}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
 
@@ -200,30 +349,293 @@ def api_delete_all_presets():
 @preset_bp.route("/get_preset", methods=["GET"])
 def api_get_preset():
     """Получить один пресет по id"""
-    preset_id = request.args.get("id")
+    preset_id = parse_id(request.args.get("id"))
     if not preset_id:
         return jsonify({"status": "error", "msg": "id required"}), 400
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT id, name, code, thickness, preset, ts, status FROM presets WHERE id=?", (preset_id,))
-        row = c.fetchone()
-        conn.close()
+        preset_data = preset_cache.get(preset_id)
+        if preset_data is not None:
+            return jsonify(preset_data), 200
+
+        generation = preset_cache.generation
+        with db.connect() as conn:
+            c = conn.cursor()
+            c.execute("""
+                SELECT p.id, p.name, p.code, p.thickness, b.data, p.ts, p.status, b.size
+                FROM presets p JOIN preset_blobs b ON b.hash = p.blob_hash
+                WHERE p.id=?
+            """, (preset_id,))
+            row = c.fetchone()
 
         if not row:
             return jsonify({"status": "error", "msg": f"Preset {preset_id} not found"}), 404
 
-        preset_data = {
-            "id": row[0],
-            "name": row[1],
-            "code": row[2],
-            "thickness": row[3],
-            "preset": json.loads(row[4]),
-            "ts": row[5],
-            "status": row[6],
-        }
+        preset_data = row_to_preset(row)
+        preset_cache.put(preset_id, preset_data, row[7], generation)
+        return jsonify(preset_data), 200
+
+    except db.PoolExhausted as e:
+        return db_busy(e)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@preset_bp.route("/find_preset", methods=["GET"])
+def api_find_preset():
+    """
+    Найти пресет по материалу и толщине:
+    ?code=St37&thickness=3 или ?code=St37&thickness_min=2.5&thickness_max=3.5
+    nearest=false — без подбора ближайшей толщины
+    """
+    code = request.args.get("code")
+    thickness = request.args.get("thickness", type=float)
+    thickness_min = request.args.get("thickness_min", type=float)
+    thickness_max = request.args.get("thickness_max", type=float)
+    nearest = request.args.get("nearest", "true").lower() != "false"
+
+    if not code:
+        return jsonify({"status": "error", "msg": "code required"}), 400
+    if thickness is None and thickness_min is None and thickness_max is None:
+        return jsonify({"status": "error", "msg": "thickness or thickness_min/thickness_max required"}), 400
+
+    try:
+        row, match = find_preset(code, thickness, thickness_min, thickness_max, nearest)
+        if not row:
+            return jsonify({"status": "error", "msg": f"Preset for {code} not found"}), 404
+
+        preset_data = row_to_preset(row)
+        preset_data["match"] = match
         return jsonify(preset_data), 200
 
+    except db.PoolExhausted as e:
+        return db_busy(e)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@preset_bp.route("/cache_stats", methods=["GET"])
+def api_cache_stats():
+    """Счётчики кэша пресетов"""
+    return jsonify(preset_cache.stats()), 200
+
+
+def iter_lines(stream, chunk_size=64 * 1024):
+    """Строки потока без чтения всего тела в память"""
+    tail = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+def parse_import_row(raw):
+    """
+    Строка NDJSON -> (name, code, thickness, data).
+    Принимает строки экспорта ({"name", "preset": {...}}) и тела savepreset.
+    """
+    obj = json.loads(raw)
+    if not isinstance(obj, dict):
+        raise ValueError("row must be a JSON object")
+    data = obj["preset"] if isinstance(obj.get("preset"), dict) else obj
+    code = data["material"]["name"]
+    thickness = float(data["material"]["thickness"])
+    name = obj.get("name") or data.get("name") or f"{code}_{data['material']['thickness']}"
+    return name, code, thickness, data
+
+
+def import_batch(rows, upsert):
+    """Одна транзакция на пачку; возвращает (inserted, updated, errors)"""
+    inserted = updated = 0
+    errors = []
+    now = datetime.datetime.utcnow()
+    with db.connect() as conn:
+        for line_no, (name, code, thickness, data) in rows:
+            try:
+                if upsert:
+                    row = conn.execute("""
+                        SELECT id FROM presets
+                        WHERE status='active' AND code=? AND thickness=?
+                        ORDER BY ts DESC, id DESC LIMIT 1
+                    """, (code, thickness)).fetchone()
+                    if row and preset_store.update_preset(conn, row[0], name, code, thickness, data, now):
+                        updated += 1
+                        continue
+                preset_store.insert_preset(conn, name, code, thickness, data, now)
+                inserted += 1
+            except sqlite3.Error as e:
+                errors.append({"line": line_no, "error": str(e)})
+    return inserted, updated, errors
+
+
+@preset_bp.route("/export_presets", methods=["GET"])
+def api_export_presets():
+    """
+    Выгрузка пресетов потоком NDJSON, по строке на пресет
+    Фильтры: all=true, code=..., name=... (подстрока)
+    """
+    include_all = request.args.get("all", "false").lower() == "true"
+    code = request.args.get("code")
+    name = request.args.get("name")
+
+    query = """
+        SELECT p.id, p.name, p.code, p.thickness, p.status, p.ts, b.data
+        FROM presets p JOIN preset_blobs b ON b.hash = p.blob_hash
+    """
+    where, params = ["p.id > ?"], []
+    if not include_all:
+        where.append("p.status='active'")
+    if code:
+        where.append("p.code=?")
+        params.append(code)
+    if name:
+        where.append("p.name LIKE ? ESCAPE '\\'")
+        params.append(like_substring(name))
+    query += " WHERE " + " AND ".join(where) + " ORDER BY p.id LIMIT ?"
+
+    def fetch_batch(after_id):
+        # Соединение берётся на одну пачку (keyset по p.id): медленный клиент
+        # не держит соединение пула и транзакцию чтения всю выгрузку
+        with db.connect() as conn:
+            return conn.execute(query, [after_id] + params + [config.PRESET_EXPORT_FETCH]).fetchall()
+
+    def generate(rows):
+        while rows:
+            for r in rows:
+                meta = {"id": r[0], "name": r[1], "code": r[2], "thickness": r[3], "status": r[4], "ts": r[5]}
+                # preset уже хранится как JSON — вставляем текст без разбора
+                yield json.dumps(meta, ensure_ascii=False)[:-1] + ', "preset": ' + preset_store.load_text(r[6]) + "}\n"
+            rows = fetch_batch(rows[-1][0])
+
+    # Первая пачка — до ответа, чтобы занятый пул вернул 503, а не оборванный файл
+    try:
+        first = fetch_batch(0)
+    except db.PoolExhausted as e:
+        return db_busy(e)
+    return Response(generate(first), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=presets.ndjson"})
+
+
+@preset_bp.route("/import_presets", methods=["POST"])
+def api_import_presets():
+    """
+    Загрузка пресетов из NDJSON пачками по PRESET_IMPORT_BATCH строк в транзакции
+    mode=upsert — заменить активный пресет с тем же (code, thickness) вместо добавления
+    """
+    upsert = request.args.get("mode", "insert") == "upsert"
+    inserted = updated = failed = 0
+    errors = []
+
+    def add_errors(items):
+        nonlocal failed
+        failed += len(items)
+        room = config.PRESET_IMPORT_MAX_ERRORS - len(errors)
+        if room > 0:
+            errors.extend(items[:room])
+
+    try:
+        batch = []
+        for line_no, raw in enumerate(iter_lines(request.stream), start=1):
+            if not raw.strip():
+                continue
+            try:
+                batch.append((line_no, parse_import_row(raw)))
+            except (ValueError, KeyError, TypeError) as e:
+                add_errors([{"line": line_no, "error": f"{type(e).__name__}: {e}"}])
+                continue
+            if len(batch) >= config.PRESET_IMPORT_BATCH:
+                i, u, errs = import_batch(batch, upsert)
+                inserted, updated = inserted + i, updated + u
+                add_errors(errs)
+                batch = []
+        if batch:
+            i, u, errs = import_batch(batch, upsert)
+            inserted, updated = inserted + i, updated + u
+            add_errors(errs)
+    except db.PoolExhausted as e:
+        return db_busy(e, inserted=inserted, updated=updated)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e), "inserted": inserted, "updated": updated}), 500
+    finally:
+        if updated:
+            preset_cache.clear()
+
+    return jsonify({
+        "status": "ok",
+        "inserted": inserted,
+        "updated": updated,
+        "failed": failed,
+        "errors": errors,
+    }), 200
+
+
+@preset_bp.route("/preset_revisions", methods=["GET"])
+def api_preset_revisions():
+    """История ревизий пресета по id"""
+    preset_id = request.args.get("id", type=int)
+    if not preset_id:
+        return jsonify({"status": "error", "msg": "id required"}), 400
+    try:
+        with db.connect() as conn:
+            current, revisions = preset_store.list_revisions(conn, preset_id)
+        if current is None:
+            return jsonify({"status": "error", "msg": f"Preset {preset_id} not found"}), 404
+        return jsonify({"id": preset_id, "current": current, "revisions": revisions}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@preset_bp.route("/get_preset_revision", methods=["GET"])
+def api_get_preset_revision():
+    """Содержимое пресета в ревизии rev"""
+    preset_id = request.args.get("id", type=int)
+    rev = request.args.get("rev", type=int)
+    if not preset_id or not rev:
+        return jsonify({"status": "error", "msg": "id and rev required"}), 400
+    try:
+        with db.connect() as conn:
+            revision = preset_store.get_revision(conn, preset_id, rev)
+        if revision is None:
+            return jsonify({"status": "error", "msg": f"Revision {rev} of preset {preset_id} not found"}), 404
+        revision["id"] = preset_id
+        return jsonify(revision), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e)}), 500
+
+
+@preset_bp.route("/restore_preset", methods=["POST"])
+def api_restore_preset():
+    """Восстановить ревизию: её содержимое сохраняется как новая ревизия"""
+    try:
+        data = request.get_json(force=True)
+        preset_id = parse_id(data.get("id"))
+        rev = data.get("rev")
+        if not preset_id or not rev:
+            return jsonify({"status": "error", "msg": "id and rev required"}), 400
+
+        with db.connect() as conn:
+            revision = preset_store.get_revision(conn, preset_id, int(rev))
+            if revision is None:
+                return jsonify({"status": "error", "msg": f"Revision {rev} of preset {preset_id} not found"}), 404
+            updated = preset_store.update_preset(conn, preset_id, revision["name"], revision["code"],
+                                                 revision["thickness"], revision["preset"],
+                                                 datetime.datetime.utcnow())
+        preset_cache.invalidate(preset_id)
+
+        if not updated:
+            return jsonify({"status": "error", "msg": "Preset not found or deleted"}), 404
+        return jsonify({"status": "ok", "msg": f"Preset {preset_id} restored to revision {rev}"}), 200
+    except db.PoolExhausted as e:
+        return db_busy(e)
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e)}), 500
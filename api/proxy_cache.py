@@ -0,0 +1,90 @@
+import time
+import json
+import hashlib
+import threading
+import config
+
+
+def spawn_thread(fn):
+    """Фоновый поток — если кэш используется без socketio (бенчмарки, скрипты)"""
+    threading.Thread(target=fn, daemon=True).start()
+
+
+class CacheEntry:
+    __slots__ = ("value", "etag", "fetched_at", "refreshing")
+
+    def __init__(self, value):
+        self.value = value
+        self.etag = hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+        self.fetched_at = time.monotonic()
+        self.refreshing = False
+
+
+class ProxyCache:
+    """
+    Кэш ответов контроллера с TTL по ресурсам и stale-while-revalidate:
+    после ttl ответ ещё stale секунд отдаётся из кэша, а свежий запрашивается в фоне.
+    """
+
+    def __init__(self, policies=None, spawn=None):
+        self.policies = policies if policies is not None else config.PROXY_CACHE
+        # spawn(fn) — запуск фонового обновления; app.py подставляет
+        # socketio.start_background_task, как для остальных фоновых тасков
+        self.spawn = spawn or spawn_thread
+        self._entries = {}
+        # Поколение ресурса растёт при invalidate: ответ, запрошенный до
+        # изменения настроек, не попадает в кэш после него
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def _policy(self, key):
+        # "cut_settings:1" — ресурс cut_settings для gcore 1, политика общая
+        return self.policies.get(key.partition(":")[0], {"ttl": 0, "stale": 0})
+
+    def get(self, key, fetch):
+        """Значение ресурса key; fetch() — запрос к контроллеру"""
+        policy = self._policy(key)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < policy["ttl"]:
+                return entry
+            if age < policy["ttl"] + policy["stale"]:
+                self._refresh_in_background(key, entry, fetch)
+                return entry
+        generation = self._generations.get(key, 0)
+        return self._store(key, fetch(), generation)
+
+    def _store(self, key, value, generation):
+        entry = CacheEntry(value)
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = entry
+        return entry
+
+    def _refresh_in_background(self, key, entry, fetch):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        generation = self._generations.get(key, 0)
+
+        def refresh():
+            try:
+                self._store(key, fetch(), generation)
+            except Exception as e:
+                # Контроллер недоступен — продолжаем отдавать старый ответ
+                print(f"[proxy_cache] refresh {key} failed: {e}")
+            finally:
+                entry.refreshing = False
+
+        self.spawn(refresh)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+
+proxy_cache = ProxyCache()
@@ -1,21 +1,77 @@
-from flask import Blueprint, request, jsonify, Response
-import os, json, re
+from flask import Blueprint, request, jsonify, Response, current_app, abort
+import os, json
 import requests
 import config
+from api.breaker import ControllerUnavailable
+from api.upload import UploadStream, UploadTooLarge
+from api.gcode import GcodeAnalyzer, analyze_text
+from api.lru import LRUCache
+from api.machines import machines
+from api.translations import get_translator, translation_index
+from api.functions_store import FunctionsStore, VersionConflict
 
 
 api_bp = Blueprint("api", __name__)
 
 EXTERNAL_API = config.EXTERNAL_API
-TRANSLATIONS_DIR = "/home/woodver/salaser/src/scripts/translations"
 FUNCTIONS_FILE = "functions.json"
 
 
+def machine_route(rule, **options):
+    """
+    Маршрут станка: rule — станок по умолчанию (как раньше),
+    /m/<machine_id>rule — любой станок из config.MACHINES
+    """
+    def decorator(view):
+        api_bp.add_url_rule(rule, view_func=view, defaults={"machine_id": None}, **options)
+        api_bp.add_url_rule(f"/m/<machine_id>{rule}", view_func=view, **options)
+        return view
+    return decorator
+
+
+def not_found(message):
+    """Прерывает запрос ответом 404 {"error": message}"""
+    abort(Response(json.dumps({"error": message}), status=404, mimetype="application/json"))
+
+
+def get_machine(machine_id):
+    machine = machines.get(machine_id)
+    if machine is None:
+        not_found(f"Unknown machine: {machine_id}")
+    return machine
+
+
+def get_core(machine, core=None):
+    """
+    gcore из пути или ?core= (по умолчанию первый gcore станка);
+    проверяется, только если у станка в конфиге перечислены gcores
+    """
+    if core is None:
+        core = request.args.get("core", machine.default_core, type=int)
+    if not machine.any_core and core not in machine.gcores:
+        not_found(f"Unknown gcore {core} on machine {machine.id}")
+    return core
+
+
+def controller_unavailable(e, machine):
+    """503 без ожидания таймаута: предохранитель контроллера разомкнут"""
+    return jsonify({"error": str(e), "machine": machine.id, "health": machine.controller.breaker.status()}), 503
+
+
+@api_bp.route("/machines", methods=["GET"])
+def list_machines():
+    """Станки шлюза с состоянием связи"""
+    return jsonify([machine.info() for machine in machines])
+
+
 # Если файла нет — создаём пустой по умолчанию
 if not os.path.exists(FUNCTIONS_FILE):
     with open(FUNCTIONS_FILE, 'w', encoding='utf-8') as f:
         json.dump([], f, ensure_ascii=False, indent=2)
 
+# functions.json в памяти, перечитывается только при изменении файла
+functions_store = FunctionsStore(FUNCTIONS_FILE)
+
 
 
 @api_bp.route("/savepreset", methods=["POST"])
@@ -47,16 +103,20 @@ def save_preset():
 
 
 
-@api_bp.route("/loadresult", methods=["GET"])
-def get_load_result():
+@machine_route("/loadresult", methods=["GET"])
+def get_load_result(machine_id):
     """Прокси для получения loadresult"""
+    machine = get_machine(machine_id)
+    core = get_core(machine)
     try:
-        resp = requests.get(EXTERNAL_API + "/py/gcores[0].loadresult", timeout=5)
-        resp.raise_for_status()
-        data = resp.text.strip()
+        data = machine.singleflight.do(f"loadresult:{core}", lambda: machine.fetch_load_result(core))
         if not data:
             return jsonify({"error": "Empty response"}), 502
+        # Новая программа на станке — listing в кэше больше не актуален
+        machine.note_program(core, data)
         return data
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
     except requests.Timeout:
         return jsonify({"error": "Request to external server timed out"}), 504
     except requests.RequestException as e:
@@ -64,72 +124,205 @@ def get_load_result():
 
 
 
-@api_bp.route("/listing", methods=["GET"])
-def get_listing():
-    """Прокси для получения G-code listing"""
+# Разобранные программы по хэшу: (summary, preview); превью с другим допуском —
+# отдельными записями "<hash>@<допуск>". Ключ — содержимое, поэтому кэш общий для станков
+preview_cache = LRUCache(config.GCODE_PREVIEW_CACHE_ENTRIES, config.GCODE_PREVIEW_CACHE_BYTES)
+
+
+@machine_route("/listing", methods=["GET"])
+def get_listing(machine_id):
+    """
+    G-code listing из кэша.
+    ?from=&to= — диапазон строк [from, to) с нуля, поддерживается If-None-Match
+    """
+    machine = get_machine(machine_id)
+    core = get_core(machine)
     try:
-        resp = requests.get(EXTERNAL_API + "/gcore/0/listing", timeout=5)
-        resp.raise_for_status()
-        # возвращаем сырой текст (React ждёт именно текст)
-        return Response(resp.text, mimetype="text/plain")
+        start = request.args.get("from", type=int)
+        end = request.args.get("to", type=int)
+        listing = machine.listing_cache(core).get()
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
     except requests.Timeout:
         return Response("Request to external server timed out", status=504, mimetype="text/plain")
     except requests.RequestException as e:
         return Response(f"External server error: {str(e)}", status=502, mimetype="text/plain")
+
+    # возвращаем сырой текст (React ждёт именно текст)
+    if start is None and end is None:
+        text, start, end = listing.text, 0, listing.line_count
+    else:
+        text, start, end = listing.lines(start, end)
+
+    resp = Response(text, mimetype="text/plain")
+    resp.set_etag(listing.etag)
+    resp.headers["X-Total-Lines"] = str(listing.line_count)
+    resp.headers["X-Line-From"] = str(start)
+    resp.headers["X-Line-To"] = str(end)
+    return resp.make_conditional(request)
     
 
 
-@api_bp.route("/gcore/<int:core>/upload", methods=["POST"])
-def upload_gcode(core: int):
+@machine_route("/gcore/<int:core>/upload", methods=["POST"])
+def upload_gcode(machine_id, core: int):
     """
     Прокси для загрузки G-code на станок
-    Получает тело запроса (строку или бинарные данные) и отправляет на внешний сервер
+    Тело запроса не буферизуется: входной поток кусками передаётся на внешний сервер,
+    прогресс отправляется событием upload_progress по SocketIO
     """
+    machine = get_machine(machine_id)
+    core = get_core(machine, core)
+    total = request.content_length
+    if total is not None and total > config.UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"Body too large, limit {config.UPLOAD_MAX_BYTES} bytes"}), 413
+
+    body = UploadStream(request.stream, core, total=total,
+                        socketio=current_app.extensions.get("socketio"),
+                        namespace=machine.namespace, machine=machine.id)
+    # Разбор идёт по тем же кускам, что уходят на станок; подписываемся до prime()
+    analyzer = GcodeAnalyzer()
+    body.listeners.append(analyzer)
     try:
-        content = request.get_data()  # raw body, без парсинга
-        if not content:
+        if not body.prime():
             return jsonify({"error": "Empty body"}), 400
-
-        # Формируем URL на внешнем сервере
-        url = f"{EXTERNAL_API}/gcore/{core}/upload"
+        body.emit("started")
 
         # Отправляем POST на внешний сервер
-        resp = requests.post(url, data=content, headers={"Content-Type": "application/octet-stream"}, timeout=10)
+        resp = machine.controller.post("upload", f"/gcore/{core}/upload", data=body,
+                                       headers={"Content-Type": "application/octet-stream"})
         resp.raise_for_status()
+        summary = analyzer.finish()
+        preview_cache.put(summary["hash"], (summary, analyzer.preview), analyzer.preview.nbytes)
+        machine.note_upload(core, summary["hash"])
 
+        body.emit("done", external_status=resp.status_code, analysis=summary)
         # Возвращаем результат как JSON
-        return jsonify({"status": "ok", "external_status": resp.status_code})
+        return jsonify({"status": "ok", "external_status": resp.status_code, "bytes": body.received,
+                        "analysis": summary})
+    except UploadTooLarge as e:
+        body.emit("error", error=str(e))
+        return jsonify({"error": str(e)}), 413
+    except ControllerUnavailable as e:
+        body.emit("error", error=str(e))
+        return controller_unavailable(e, machine)
     except requests.RequestException as e:
+        body.emit("error", error=str(e))
         return jsonify({"error": f"External server error: {str(e)}"}), 502
 
 
 
-@api_bp.route("/cut-settings", methods=["GET", "PUT", "DELETE"])
-def cut_settings():
+def program_preview(machine, core):
+    """(summary, preview) текущей программы gcore станка"""
+    program_hash = machine.core_programs.get(core)
+    if program_hash is not None:
+        cached = preview_cache.get(program_hash)
+        if cached is not None:
+            return cached
+
+    # Программа загружена не через этот сервер (или вытеснена) — разбираем listing
+    listing = machine.listing_cache(core).get()
+    key = f"listing:{listing.etag}"
+
+    def analyze():
+        cached = preview_cache.get(key)
+        if cached is None:
+            analyzer = analyze_text(listing.text)
+            cached = (analyzer.summary(), analyzer.preview)
+            preview_cache.put(key, cached, analyzer.preview.nbytes)
+        return cached
+
+    # Разбор большой программы долгий: одновременные запросы превью ждут один разбор
+    return preview_cache.get(key) or machine.singleflight.do(f"preview:{listing.etag}", analyze,
+                                                                    name="preview")
+
+
+@machine_route("/gcore/<int:core>/preview", methods=["GET"])
+def gcode_preview(machine_id, core):
+    """
+    Анализ программы и прореженная траектория для отрисовки.
+    ?tolerance=<мм> — допуск прореживания (не меньше GCODE_PREVIEW_TOLERANCE),
+    ?rapids=0 — без холостых ходов. Поддерживается If-None-Match.
+    """
+    try:
+        tolerance = float(request.args.get("tolerance", config.GCODE_PREVIEW_TOLERANCE))
+    except ValueError:
+        return jsonify({"error": "tolerance must be a number"}), 400
+    tolerance = max(tolerance, config.GCODE_PREVIEW_TOLERANCE)
+    rapids = request.args.get("rapids", "1") not in ("0", "false")
+    machine = get_machine(machine_id)
+    core = get_core(machine, core)
+
+    try:
+        program = program_preview(machine, core)
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
+    except requests.RequestException as e:
+        return jsonify({"error": f"External server error: {str(e)}"}), 502
+
+    summary, preview = program
+    if tolerance > config.GCODE_PREVIEW_TOLERANCE:
+        key = f"{summary['hash']}@{tolerance}"
+        coarse = preview_cache.get(key)
+        if coarse is None:
+            coarse = preview.simplified(tolerance)
+            preview_cache.put(key, coarse, coarse.nbytes)
+        preview = coarse
+
+    resp = jsonify({
+        "machine": machine.id,
+        "core": core,
+        "summary": summary,
+        "tolerance": tolerance,
+        "points": len(preview),
+        "polylines": preview.to_json(rapids),
+    })
+    resp.set_etag(f"{summary['hash']}-{tolerance}-{int(rapids)}")
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+def cached_response(entry):
+    """JSON из кэша с ETag; 304, если у браузера та же версия"""
+    resp = jsonify(entry.value)
+    resp.set_etag(entry.etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+@machine_route("/cut-settings", methods=["GET", "PUT", "DELETE"])
+def cut_settings(machine_id):
     """Прокси для cut_settings/settings"""
+    machine = get_machine(machine_id)
+    core = get_core(machine)
+    key = f"cut_settings:{core}"
     try:
-        url = f"{EXTERNAL_API}/cut_settings/settings"
-        params = {"gcore": 0}
+        path = "/cut_settings/settings"
+        params = {"gcore": core}
 
         if request.method == "GET":
-            resp = requests.get(url, params=params, timeout=5)
+            return cached_response(machine.proxy_cache.get(
+                key, lambda: machine.singleflight.do(key, lambda: machine.fetch_cut_settings(core))))
         elif request.method == "PUT":
             try:
                 data = request.get_json(force=True)  # получаем тело запроса
             except Exception:
                 data = None
                 
-            resp = requests.put(url, params=params, json=data, timeout=5)
+            resp = machine.controller.put("cut_settings", path, params=params, json=data)
 
         elif request.method == "DELETE":
-            resp = requests.delete(url, params=params, timeout=5)
+            resp = machine.controller.delete("cut_settings", path, params=params)
         else:
             return jsonify({"error": "Метод не поддерживается"}), 405
 
+        # Настройки на станке изменились — кэш больше не актуален
+        machine.proxy_cache.invalidate(key)
         resp.raise_for_status()
         data = resp.json()
         return jsonify(data)
 
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
     except requests.Timeout:
         return jsonify({"error": "Внешний сервер не отвечает"}), 504
     except requests.RequestException as e:
@@ -137,15 +330,17 @@ def cut_settings():
     
 
 
-@api_bp.route("/cut-settings-schema", methods=["GET"])
-def get_cut_settings_schema():
-    """Прокси для cut_settings_schema"""
+@machine_route("/cut-settings-schema", methods=["GET"])
+def get_cut_settings_schema(machine_id):
+    """Прокси для cut_settings_schema (кэшируется, схема меняется только с прошивкой)"""
+    machine = get_machine(machine_id)
+    core = get_core(machine)
+    key = f"cut_settings_schema:{core}"
     try:
-        url = f"{EXTERNAL_API}/cut_settings/schema?gcore=0"
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()  # JSON от внешнего сервера
-        return jsonify(data)  # Возвращаем как JSON
+        return cached_response(machine.proxy_cache.get(
+            key, lambda: machine.singleflight.do(key, lambda: machine.fetch_cut_settings_schema(core))))
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
     except requests.Timeout:
         return jsonify({"error": "Внешний сервер не отвечает"}), 504
     except requests.RequestException as e:
@@ -153,43 +348,41 @@ def get_cut_settings_schema():
     
 
 
-@api_bp.route("/gcore/<int:gcore_num>/execute", methods=["GET"])
-def proxy_execute(gcore_num):
+@machine_route("/gcore/<int:gcore_num>/execute", methods=["GET"])
+def proxy_execute(machine_id, gcore_num):
     """Прокси для gcore/{gcore_num}/execute"""
+    machine = get_machine(machine_id)
+    gcore_num = get_core(machine, gcore_num)
     try:
-        url = f"{EXTERNAL_API}/gcore/{gcore_num}/execute"
-        resp = requests.get(url, timeout=5)
+        resp = machine.controller.get("execute", f"/gcore/{gcore_num}/execute")
         resp.raise_for_status()
         return resp.text  # просто возвращаем текст от удалённого сервера
 
+    except ControllerUnavailable as e:
+        return controller_unavailable(e, machine)
     except requests.Timeout:
         return jsonify({"error": "Внешний сервер не отвечает"}), 504
     except requests.RequestException as e:
         return jsonify({"error": f"Ошибка внешнего сервера: {str(e)}"}), 502
     
 
-def read_tsx_translations(file_path):
-    """Читает объект из tsx-файла и возвращает словарь переводов"""
-    translations = {}
-    if not os.path.exists(file_path):
-        return translations
-    with open(file_path, "r", encoding="utf-8") as f:
-        content = f.read()
-        # Находим все строки вида "ключ": "значение",
-        matches = re.findall(r'"(.*?)"\s*:\s*"(.*?)"', content, re.DOTALL)
-        for k, v in matches:
-            translations[k] = v
-    return translations
-
-def write_tsx_translations(file_path, translations, lang):
-    """Записывает словарь переводов обратно в tsx-файл"""
-    lines = [f'const {lang}: Record<string, string> = {{']
-    for key, value in translations.items():
-        lines.append(f'\t"{key}": "{value}",')
-    lines.append('}')
-    lines.append(f'export default {lang};')
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+@machine_route("/controller/health", methods=["GET"])
+def controller_health(machine_id):
+    """Состояние предохранителя контроллера"""
+    return jsonify(get_machine(machine_id).controller.breaker.status())
+
+
+@machine_route("/controller/stats", methods=["GET"])
+def controller_stats(machine_id):
+    """Счётчики пула соединений к контроллеру по эндпоинтам"""
+    return jsonify(get_machine(machine_id).controller.stats())
+
+
+@machine_route("/controller/singleflight", methods=["GET"])
+def singleflight_stats(machine_id):
+    """Сколько одинаковых запросов к контроллеру было объединено"""
+    return jsonify(get_machine(machine_id).singleflight.stats())
+
 
 @api_bp.route("/translate", methods=["GET"])
 def translate_phrase():
@@ -197,55 +390,71 @@ def translate_phrase():
     if not phrase:
         return jsonify({"error": "Missing 'phrase' parameter"}), 400
 
-    results = {}
+    results = get_translator().translate_batch([phrase])
+    return jsonify({lang: translated[phrase] for lang, translated in results.items()})
+
+
+@api_bp.route("/translate_batch", methods=["POST"])
+def translate_batch():
+    """
+    Перевод нескольких фраз сразу: {"phrases": [...], "langs": [...] (необязательно)}
+    Ответ: {lang: {phrase: перевод}}
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    phrases = [p for p in data.get("phrases", []) if isinstance(p, str) and p]
+    if not phrases:
+        return jsonify({"error": "Missing 'phrases' list"}), 400
+
+    try:
+        return jsonify(get_translator().translate_batch(phrases, data.get("langs")))
+    except OSError as e:
+        return jsonify({"error": str(e)}), 500
+
 
-    # Перебираем все tsx-файлы в папке translations
-    for filename in os.listdir(TRANSLATIONS_DIR):
-        if filename.endswith(".tsx"):
-            lang = filename.split(".")[0]
-            file_path = os.path.join(TRANSLATIONS_DIR, filename)
+@api_bp.route("/translations/<lang>", methods=["GET"])
+def get_translations(lang):
+    """Словарь переводов языка из индекса в памяти, с ETag"""
+    entry = translation_index.get(lang)
+    if entry is None:
+        return jsonify({"error": f"Language '{lang}' not found"}), 404
+    resp = jsonify(entry.data)
+    resp.set_etag(entry.etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
-            translations = read_tsx_translations(file_path)
 
-            # Для английского просто дублируем
-            if lang == "en":
-                translations[phrase] = phrase
-                results[lang] = phrase
-            else:
-                url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=en&tl={lang}&dt=t&q={requests.utils.quote(phrase)}"
-                print(f"[DEBUG] Переводим '{phrase}' → язык {lang} (url={url})")
-                try:
-                    r = requests.get(url)
-                    r.raise_for_status()
-                    data = r.json()
-                    translated_text = data[0][0][0] if data and len(data) > 0 else phrase
-                    translations[phrase] = translated_text
-                    results[lang] = translated_text
-                except Exception:
-                    translations[phrase] = phrase
-                    results[lang] = phrase
+def if_match():
+    """Проверка If-Match для записи; None — заголовок не прислали"""
+    etags = request.if_match
+    if not etags:
+        return None
+    return lambda etag: etags.star_tag or etags.contains(etag)
 
-            write_tsx_translations(file_path, translations, lang)
 
-    return jsonify(results)
+def functions_conflict(e):
+    resp = jsonify({"error": str(e), "etag": e.etag})
+    resp.status_code = 409
+    resp.set_etag(e.etag)
+    return resp
 
 
 @api_bp.route("/get_functions", methods=["GET"])
 def get_functions():
 
     try:
-        if not os.path.exists(FUNCTIONS_FILE):
+        try:
+            _, raw, etag = functions_store.get()
+        except FileNotFoundError:
             return jsonify({"error": "File not found"}), 404
 
-        with open(FUNCTIONS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        return jsonify(data)
+        resp = Response(raw, mimetype="application/json")
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp.make_conditional(request)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-
 @api_bp.route("/save_functions", methods=["POST"])
 def save_functions():
     try:
@@ -255,10 +464,65 @@ def save_functions():
         # if "functions" not in data or not isinstance(data["functions"], list):
         #     return jsonify({"error": "Invalid data format"}), 400
 
-        with open(FUNCTIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Без If-Match — перезапись как раньше; с ним 409, если файл уже поменяли
+        etag = functions_store.save(data, if_match())
 
-        return jsonify({"status": "success", "message": "Functions saved successfully"}), 200
+        resp = jsonify({"status": "success", "message": "Functions saved successfully", "etag": etag})
+        resp.set_etag(etag)
+        return resp, 200
 
+    except VersionConflict as e:
+        return functions_conflict(e)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@api_bp.route("/functions/<section>", methods=["GET", "PUT"])
+def functions_section(section):
+    """Один раздел functions.json (Edge_detection, Microjoints, ...)"""
+    try:
+        if request.method == "GET":
+            value, etag = functions_store.get_section(section)
+            resp = jsonify(value)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp.make_conditional(request)
+
+        data = request.get_json(force=True)
+        etag = functions_store.save_section(section, data, if_match())
+        resp = jsonify({"status": "success", "section": section, "etag": etag})
+        resp.set_etag(etag)
+        return resp, 200
+
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
+    except KeyError:
+        return jsonify({"error": f"Unknown section: {section}"}), 404
+    except VersionConflict as e:
+        return functions_conflict(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@machine_route("/telemetry/history", methods=["GET"])
+def telemetry_history_view(machine_id):
+    """
+    История положений осей: ?since=<UNIX-время>&axes=X,Y&max_points=1000&method=lttb|minmax.
+    В ответе "last" — время последнего отсчёта, его удобно передать как since в следующий раз.
+    """
+    try:
+        since = float(request.args["since"]) if request.args.get("since") else None
+        max_points = int(request.args.get("max_points", config.TELEMETRY_HISTORY_DEFAULT_POINTS))
+    except ValueError:
+        return jsonify({"error": "since must be a number, max_points an integer"}), 400
+    method = request.args.get("method", "lttb")
+    axes = [a for a in request.args.get("axes", "").split(",") if a] or None
+
+    if method not in ("lttb", "minmax"):
+        return jsonify({"error": f"Unknown method: {method}"}), 400
+    if max_points < 3:
+        return jsonify({"error": "max_points must be >= 3"}), 400
+    max_points = min(max_points, config.TELEMETRY_HISTORY_MAX_POINTS)
+
+    history = get_machine(machine_id).history
+    return jsonify(history.query(since=since, axes=axes, max_points=max_points, method=method))
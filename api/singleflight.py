@@ -0,0 +1,76 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("name", "done", "result", "error", "waiters")
+
+    def __init__(self, name):
+        self.name = name
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных запросов: пока запрос с ключом key
+    выполняется, остальные вызовы с тем же ключом ждут и получают его результат
+    (или то же исключение). Новый вызов после завершения идёт к контроллеру заново.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def do(self, key, fn, name=None):
+        """
+        name — имя в статистике, если key не ограничен (например, содержит ETag):
+        объединяются вызовы по key, а счётчики копятся по name
+        """
+        with self._lock:
+            stats = self._stats.setdefault(name or key, {"calls": 0, "executed": 0, "collapsed": 0})
+            stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                stats["collapsed"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call(name or key)
+                stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            # Лидер прерван (GreenletExit, KeyboardInterrupt) — ожидающие не
+            # должны получить None вместо результата; прерывание чужого
+            # гринлета им не передаём, отдаём обычную ошибку
+            if isinstance(e, Exception):
+                call.error = e
+            else:
+                call.error = RuntimeError(f"singleflight {key}: leader aborted ({type(e).__name__})")
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            running = {call.name for call in self._calls.values()}
+            for name, s in self._stats.items():
+                item = dict(s)
+                item["in_flight"] = name in running
+                result[name] = item
+            return result
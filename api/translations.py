@@ -0,0 +1,252 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import eventlet
+import requests
+import config
+from api.fileutil import atomic_write
+
+
+# --- Файлы переводов ---
+# Строки вида "ключ": "значение",
+TSX_ENTRY_RE = re.compile(r'"(.*?)"\s*:\s*"(.*?)"', re.DOTALL)
+
+
+def read_tsx_translations(file_path):
+    """Читает объект из tsx-файла и возвращает словарь переводов"""
+    translations = {}
+    if not os.path.exists(file_path):
+        return translations
+    with open(file_path, "r", encoding="utf-8") as f:
+        content = f.read()
+        for k, v in TSX_ENTRY_RE.findall(content):
+            translations[k] = v
+    return translations
+
+
+def write_tsx_translations(file_path, translations, lang):
+    """Записывает словарь переводов обратно в tsx-файл"""
+    lines = [f'const {lang}: Record<string, string> = {{']
+    for key, value in translations.items():
+        lines.append(f'\t"{key}": "{value}",')
+    lines.append('}')
+    lines.append(f'export default {lang};')
+    atomic_write(file_path, "\n".join(lines))
+
+
+def list_languages(directory=None):
+    """Язык -> путь к tsx-файлу"""
+    directory = directory or config.TRANSLATIONS_DIR
+    return {
+        filename.split(".")[0]: os.path.join(directory, filename)
+        for filename in sorted(os.listdir(directory))
+        if filename.endswith(".tsx")
+    }
+
+
+class LanguageDict:
+    __slots__ = ("path", "mtime", "size", "data", "etag")
+
+    def __init__(self, path, data, stat):
+        self.path = path
+        self.data = data
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.etag = hashlib.sha1(json.dumps(data, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class TranslationIndex:
+    """
+    Словари переводов в памяти. Файл разбирается заново только когда
+    изменились его mtime/размер (проверка не чаще TRANSLATIONS_CHECK_INTERVAL),
+    и только для этого языка.
+    """
+
+    def __init__(self, directory=None, check_interval=None):
+        self.directory = directory
+        self.check_interval = config.TRANSLATIONS_CHECK_INTERVAL if check_interval is None else check_interval
+        self.langs = {}
+        self._paths = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            self._paths = list_languages(self.directory)
+        except OSError as e:
+            print(f"[translations] {e}")
+            self._paths = {}
+        for lang in list(self.langs):
+            if lang not in self._paths:
+                del self.langs[lang]
+        for lang, path in self._paths.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            current = self.langs.get(lang)
+            if current is None or current.mtime != stat.st_mtime_ns or current.size != stat.st_size:
+                self.langs[lang] = LanguageDict(path, read_tsx_translations(path), stat)
+
+    def languages(self):
+        """Язык -> путь к tsx-файлу"""
+        with self._lock:
+            self._refresh()
+            return dict(self._paths)
+
+    def get(self, lang):
+        """LanguageDict языка или None"""
+        with self._lock:
+            self._refresh()
+            return self.langs.get(lang)
+
+    def replace(self, lang, data):
+        """Записывает словарь языка в файл и обновляет индекс без повторного разбора"""
+        with self._lock:
+            path = self._paths.get(lang) or os.path.join(self.directory or config.TRANSLATIONS_DIR, f"{lang}.tsx")
+            write_tsx_translations(path, data, lang)
+            self._paths[lang] = path
+            self.langs[lang] = LanguageDict(path, data, os.stat(path))
+
+
+# --- Бэкенды перевода ---
+class GoogleBackend:
+    """Бесплатный endpoint translate.googleapis.com"""
+
+    url = "https://translate.googleapis.com/translate_a/single"
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or config.TRANSLATION_TIMEOUT
+        self.session = requests.Session()
+
+    def translate(self, phrase, lang, source="en"):
+        r = self.session.get(self.url, params={"client": "gtx", "sl": source, "tl": lang, "dt": "t", "q": phrase},
+                             timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        return data[0][0][0] if data and len(data) > 0 else phrase
+
+
+class StubBackend:
+    """Без сети: возвращает фразу с пометкой языка"""
+
+    def translate(self, phrase, lang, source="en"):
+        return f"[{lang}] {phrase}"
+
+
+BACKENDS = {
+    "google": GoogleBackend,
+    "stub": StubBackend,
+}
+
+
+def make_backend(name=None):
+    return BACKENDS[name or config.TRANSLATION_BACKEND]()
+
+
+# --- Память переводов ---
+class TranslationMemory:
+    """Переводы, уже полученные от бэкенда: {lang: {phrase: translation}} на диске"""
+
+    def __init__(self, path=None):
+        self.path = path or config.TRANSLATION_MEMORY_FILE
+        self._lock = threading.Lock()
+        self.data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[translations] memory not loaded: {e}")
+
+    def get(self, lang, phrase):
+        return self.data.get(lang, {}).get(phrase)
+
+    def put_many(self, items):
+        """items — [(lang, phrase, translation)]; один раз пишет файл"""
+        if not items:
+            return
+        with self._lock:
+            for lang, phrase, translation in items:
+                self.data.setdefault(lang, {})[phrase] = translation
+            atomic_write(self.path, json.dumps(self.data, ensure_ascii=False, indent=1))
+
+
+class Translator:
+    """
+    Пакетный перевод во все языки: недостающие переводы запрашиваются
+    параллельно, каждый tsx-файл переписывается один раз на пакет.
+    """
+
+    def __init__(self, backend=None, memory=None, workers=None, index=None):
+        self.backend = backend or make_backend()
+        self.memory = memory or TranslationMemory()
+        self.index = index or translation_index
+        self.pool = eventlet.GreenPool(workers or config.TRANSLATION_WORKERS)
+        # Одновременные пакеты не должны перетирать файлы друг друга
+        self._write_lock = threading.Lock()
+
+    def _translate_one(self, job):
+        lang, phrase = job
+        try:
+            with eventlet.Timeout(config.TRANSLATION_TIMEOUT * 2):
+                return lang, phrase, self.backend.translate(phrase, lang), True
+        except (Exception, eventlet.Timeout) as e:
+            print(f"[translations] '{phrase}' → {lang} failed: {e}")
+            return lang, phrase, phrase, False
+
+    def translate_batch(self, phrases, langs=None):
+        """Возвращает {lang: {phrase: перевод}} и обновляет tsx-файлы"""
+        files = self.index.languages()
+        if langs:
+            files = {lang: path for lang, path in files.items() if lang in langs}
+
+        results = {lang: {} for lang in files}
+        jobs = []
+        for lang in files:
+            for phrase in phrases:
+                # Для английского просто дублируем
+                if lang == "en":
+                    results[lang][phrase] = phrase
+                    continue
+                known = self.memory.get(lang, phrase)
+                if known is not None:
+                    results[lang][phrase] = known
+                else:
+                    jobs.append((lang, phrase))
+
+        learned = []
+        for lang, phrase, translation, ok in self.pool.imap(self._translate_one, jobs):
+            results[lang][phrase] = translation
+            if ok:
+                learned.append((lang, phrase, translation))
+        self.memory.put_many(learned)
+
+        with self._write_lock:
+            for lang in files:
+                current = self.index.get(lang)
+                translations = dict(current.data) if current else {}
+                if all(translations.get(k) == v for k, v in results[lang].items()):
+                    continue
+                translations.update(results[lang])
+                self.index.replace(lang, translations)
+
+        return results
+
+
+translation_index = TranslationIndex()
+_translator = None
+
+
+def get_translator():
+    global _translator
+    if _translator is None:
+        _translator = Translator()
+    return _translator
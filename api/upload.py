@@ -0,0 +1,96 @@
+import time
+import uuid
+import config
+
+
+class UploadTooLarge(Exception):
+    """Тело запроса превысило UPLOAD_MAX_BYTES"""
+
+
+class UploadStream:
+    """
+    Потоковая обёртка над входящим телом запроса.
+    Отдаёт данные кусками прямо в requests, не держа программу в памяти,
+    считает байты, проверяет лимит и шлёт прогресс по SocketIO.
+    """
+
+    def __init__(self, stream, core, total=None, socketio=None,
+                 max_bytes=None, chunk_size=None, progress_step=None, namespace="/", machine=None):
+        self.stream = stream
+        self.core = core
+        self.namespace = namespace
+        self.machine = machine
+        self.total = total
+        self.socketio = socketio
+        self.max_bytes = max_bytes if max_bytes is not None else config.UPLOAD_MAX_BYTES
+        self.chunk_size = chunk_size or config.UPLOAD_CHUNK_SIZE
+        self.progress_step = progress_step or config.UPLOAD_PROGRESS_STEP
+
+        self.id = uuid.uuid4().hex
+        self.received = 0
+        self._next_progress = self.progress_step
+        self._pending = b""
+        # Подписчики на каждый прочитанный кусок: fn(chunk)
+        self.listeners = []
+
+    def __len__(self):
+        # requests по длине выставляет Content-Length вместо chunked
+        return self.total or 0
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def prime(self):
+        """Читает первый кусок заранее; False — если тело пустое"""
+        if not self._pending:
+            self._pending = self._read(self.chunk_size)
+        return bool(self._pending)
+
+    def read(self, size=-1):
+        if self._pending:
+            chunk, self._pending = self._pending, b""
+            return chunk
+        return self._read(size)
+
+    def _read(self, size):
+        if size is None or size < 0:
+            size = self.chunk_size
+        chunk = self.stream.read(size)
+        if not chunk:
+            return b""
+
+        self.received += len(chunk)
+        if self.received > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+
+        if self.listeners:
+            for listener in self.listeners:
+                listener(chunk)
+            # Разбор куска (GcodeAnalyzer) идёт синхронно — как в analyze_text,
+            # отдаём управление другим green-потокам eventlet после каждого куска
+            time.sleep(0)
+
+        if self.received >= self._next_progress:
+            self._next_progress = self.received + self.progress_step
+            self.emit("progress")
+        return chunk
+
+    def emit(self, state, **extra):
+        """Событие upload_progress всем клиентам станка"""
+        if self.socketio is None:
+            return
+        payload = {
+            "id": self.id,
+            "machine": self.machine,
+            "core": self.core,
+            "state": state,
+            "received": self.received,
+            "total": self.total,
+            "percent": round(self.received * 100 / self.total, 1) if self.total else None,
+        }
+        payload.update(extra)
+        self.socketio.emit("upload_progress", payload, namespace=self.namespace)
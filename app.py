@@ -1,15 +1,19 @@
 import eventlet 
 eventlet.monkey_patch()  
 
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_socketio import SocketIO
-import random
+import time
 from api.routes import api_bp
 from api.presets import preset_bp 
-import requests
 import config
+from api.machines import machines
+from telemetry import TelemetryHub
+from static_assets import StaticAssets
+import metrics
 
-app = Flask(__name__, static_folder="templates/laserMain", static_url_path="")
+# Статику отдаёт StaticAssets (кэш в памяти, сжатие, долгий кэш для файлов сборки)
+app = Flask(__name__, static_folder=None)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Подключаем Blueprint с API
@@ -23,61 +27,140 @@ EXTERNAL_API = config.EXTERNAL_API
 """ @app.before_request
 def log_request_info():
     print(f"➡️ {request.method} {request.path} | args={dict(request.args)}") """
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # Метка — шаблон маршрута (/api/gcore/<core>/listing), а не конкретный путь
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        blueprint = request.blueprint or "app"
+        metrics.http_request_seconds.observe(time.perf_counter() - started, blueprint, route, request.method)
+        metrics.http_requests_total.inc(blueprint, route, request.method, str(response.status_code))
+    return response
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/metrics/profiler", methods=["GET", "POST"])
+def profiler():
+    """
+    GET — свёрнутые стеки (?format=collapsed) или состояние профилировщика.
+    POST {"enabled": true, "interval": 0.005} — включить/выключить.
+    """
+    if request.method == "POST":
+        data = request.get_json(force=True, silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "expected JSON object"}), 400
+        interval = data.get("interval")
+        if interval is not None:
+            try:
+                interval = float(interval)
+            except (TypeError, ValueError):
+                return jsonify({"error": "interval must be a number"}), 400
+            if not config.METRICS_PROFILER_INTERVAL_MIN <= interval <= config.METRICS_PROFILER_INTERVAL_MAX:
+                return jsonify({"error": f"interval must be between {config.METRICS_PROFILER_INTERVAL_MIN}"
+                                         f" and {config.METRICS_PROFILER_INTERVAL_MAX}"}), 400
+        try:
+            if data.get("enabled"):
+                metrics.profiler.start(interval)
+            else:
+                metrics.profiler.stop()
+        except (ValueError, OSError, AttributeError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(metrics.profiler.status())
+
+    if request.args.get("format") == "collapsed":
+        return Response(metrics.profiler.collapsed(), mimetype="text/plain")
+    return jsonify(metrics.profiler.status())
     
+static_assets = StaticAssets(config.STATIC_DIR)
+static_assets.preload()
+
 @app.route("/")
 def main():
-    return send_from_directory(app.static_folder, "index.html")
+    return static_assets.serve("index.html")
 
 @app.route("/lasermain")
 def mainLaser():
-    return send_from_directory(app.static_folder, "index.html")
-
-background_task_started = False
-
-
-def generate_machine_data():
-    """Фоновый таск, отправляет данные каждые 1 сек"""
-    while True:
-        try:
-            # Пробуем получить данные с внешнего сервера
-            resp = requests.get(f"{EXTERNAL_API}/servo/dynamic", timeout=1)
-            resp.raise_for_status()
-            servo_data = resp.json()
-
-            # Берём элементы 1,2,3 (X,Y,Z) и их position
-            data = [
-                {"name": "X", "measure": "mm", "val": round(servo_data[1]["position"], 2)},
-                {"name": "Y", "measure": "mm", "val": round(servo_data[2]["position"], 2)},
-                {"name": "Z", "measure": "mm", "val": round(servo_data[3]["position"], 2)},
-            ]
-
-        except (requests.RequestException, IndexError, KeyError):
-            # Если не удалось получить данные, отправляем рандомные
-            data = [
-                {"name": "X", "measure": "mm", "val": round(random.uniform(0, 300), 2)},
-                {"name": "Y", "measure": "mm", "val": round(random.uniform(0, 1500), 2)},
-                {"name": "Z", "measure": "mm", "val": round(random.uniform(0, 30), 2)},
-            ]
-
-        # Отправляем всем подключённым клиентам через SocketIO
-        socketio.emit("machine_data", data)
-        socketio.sleep(1)  # корректно с eventlet
-
-
-@socketio.on("connect")
-def handle_connect():
-    global background_task_started
-    print("Client connected")
-
-    # Запускаем фоновый таск только один раз
-    if not background_task_started:
-        socketio.start_background_task(generate_machine_data)
-        background_task_started = True
-
-
-@socketio.on("disconnect")
-def handle_disconnect():
-    print("Client disconnected")
+    return static_assets.serve("index.html")
+
+@app.route("/<path:filename>", endpoint="static")
+def static_file(filename):
+    return static_assets.serve(filename)
+
+# Задержка цикла eventlet: таск начнёт работать, когда запустится сервер
+socketio.start_background_task(metrics.monitor_loop_lag, socketio.sleep)
+
+
+def register_machine(machine):
+    """
+    Телеметрия и события станка в его namespace SocketIO
+    ("/" у станка по умолчанию, /m/<id> у остальных)
+    """
+    ns = machine.namespace
+    # Фоновое обновление кэша ответов контроллера — таском socketio, как и опрос телеметрии
+    machine.proxy_cache.spawn = socketio.start_background_task
+    # Каналы телеметрии по комнатам SocketIO, клиентам уходят только изменения
+    hub = machine.telemetry = TelemetryHub(socketio, machine.fetch_telemetry,
+                                           channels=machine.telemetry_channels(),
+                                           resources=machine.telemetry_resources(),
+                                           namespace=ns, history=machine.history)
+
+    def push_controller_health(status):
+        """Смена состояния предохранителя контроллера — всем клиентам станка"""
+        metrics.controller_available.set(1 if status["available"] else 0, machine.id)
+        socketio.emit("controller_health", dict(status, machine=machine.id), namespace=ns)
+
+    metrics.controller_available.set(1 if machine.controller.breaker.status()["available"] else 0, machine.id)
+    machine.controller.breaker.listeners.append(push_controller_health)
+    # Пока контроллер недоступен, проверяем его в фоне с нарастающей паузой
+    socketio.start_background_task(machine.controller.monitor, socketio.sleep)
+
+    def handle_connect():
+        print(f"Client connected ({machine.id})")
+        metrics.socketio_clients.inc(ns)
+        hub.subscribe(request.sid, config.TELEMETRY_DEFAULT_CHANNELS)
+        hub.send_history(request.sid)
+        socketio.emit("controller_health", dict(machine.controller.breaker.status(), machine=machine.id),
+                      to=request.sid, namespace=ns)
+
+        # Запускаем фоновые таски только один раз
+        hub.start()
+
+    def handle_disconnect():
+        print(f"Client disconnected ({machine.id})")
+        metrics.socketio_clients.dec(ns)
+        hub.unsubscribe(request.sid)
+
+    def handle_subscribe(data):
+        """Подписка на каналы: {"channels": ["velocities", ...]}"""
+        channels = (data or {}).get("channels", [])
+        hub.subscribe(request.sid, channels)
+        return {"channels": hub.subscriptions(request.sid)}
+
+    def handle_unsubscribe(data):
+        """Отписка от каналов; без списка — от всех"""
+        channels = (data or {}).get("channels")
+        hub.unsubscribe(request.sid, channels)
+        return {"channels": hub.subscriptions(request.sid)}
+
+    socketio.on("connect", namespace=ns)(handle_connect)
+    socketio.on("disconnect", namespace=ns)(handle_disconnect)
+    socketio.on("subscribe", namespace=ns)(handle_subscribe)
+    socketio.on("unsubscribe", namespace=ns)(handle_unsubscribe)
+
+
+for machine in machines:
+    register_machine(machine)
+
+# Телеметрия станка по умолчанию (namespace "/")
+telemetry = machines.default.telemetry
 
 
 if __name__ == "__main__":
@@ -0,0 +1,302 @@
+"""
+Симулятор контроллера станка (EXTERNAL_API) для разработки и нагрузочных тестов.
+
+Отвечает на те же пути, что использует сервер: /servo/dynamic, /gcore/N/listing,
+/gcore/N/upload, /gcore/N/execute, /py/gcores[0].loadresult, /py/gcores[0].state,
+/py/laser.power, /cut_settings/settings, /cut_settings/schema.
+Задержка, разброс и отказы настраиваются аргументами и на лету через /_sim/config.
+
+Запуск из корня проекта:
+    python -m bench.controller_sim --port 18080 --latency 5 --jitter 3 --fail-rate 0.01
+    SALASERV_EXTERNAL_API=http://127.0.0.1:18080 python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote, parse_qs
+
+
+# Имя ресурса для настроек по эндпоинтам — как в config.CONTROLLER_TIMEOUTS
+ROUTES = [
+    ("GET", re.compile(r"^/servo/dynamic$"), "servo_dynamic"),
+    ("GET", re.compile(r"^/gcore/(\d+)/listing$"), "listing"),
+    ("POST", re.compile(r"^/gcore/(\d+)/upload$"), "upload"),
+    ("GET", re.compile(r"^/gcore/(\d+)/execute$"), "execute"),
+    ("GET", re.compile(r"^/py/gcores\[(\d+)\]\.loadresult$"), "loadresult"),
+    ("GET", re.compile(r"^/py/gcores\[(\d+)\]\.state$"), "gcore_state"),
+    ("GET", re.compile(r"^/py/laser\.power$"), "laser_power"),
+    ("GET", re.compile(r"^/cut_settings/settings$"), "cut_settings"),
+    ("PUT", re.compile(r"^/cut_settings/settings$"), "cut_settings"),
+    ("DELETE", re.compile(r"^/cut_settings/settings$"), "cut_settings"),
+    ("GET", re.compile(r"^/cut_settings/schema$"), "cut_settings_schema"),
+]
+
+
+def sample_program(lines=2000):
+    """Программа-пример: прямоугольные детали с пробивками"""
+    out = ["G90", "G21"]
+    for i in range(lines // 6):
+        x, y = (i % 10) * 60.0, (i // 10) * 40.0
+        out += [f"G0 X{x:.3f} Y{y:.3f}", "M3", f"G1 X{x + 50:.3f} Y{y:.3f} F3000",
+                f"G1 X{x + 50:.3f} Y{y + 30:.3f}", f"G1 X{x:.3f} Y{y + 30:.3f}", "M5"]
+    out.append("M30")
+    return "\n".join(out) + "\n"
+
+
+class Simulator:
+    """Состояние симулятора и параметры отказов (общие для всех потоков сервера)"""
+
+    def __init__(self, latency=0.0, jitter=0.0, fail_rate=0.0, drop_rate=0.0,
+                 hang_rate=0.0, hang=30.0, per_endpoint=None, seed=None):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.config = {
+            "latency": latency,      # базовая задержка ответа (мс)
+            "jitter": jitter,        # случайная добавка 0..jitter (мс)
+            "fail_rate": fail_rate,  # доля ответов 503
+            "drop_rate": drop_rate,  # доля обрывов соединения без ответа
+            "hang_rate": hang_rate,  # доля "зависших" запросов (на таймауты клиента)
+            "hang": hang,            # сколько висеть (сек)
+            # имя эндпоинта -> те же поля, перекрывают общие
+            "endpoints": per_endpoint or {},
+        }
+        self.started = time.monotonic()
+        self.programs = {}
+        self.running = {}
+        self.settings = {"result": {"power": 80, "speed": 2500, "gas": "O2", "pressure": 0.6}}
+        self.schema = {"result": {"type": "object", "properties": {
+            "power": {"type": "number"}, "speed": {"type": "number"},
+            "gas": {"type": "string"}, "pressure": {"type": "number"}}}}
+        self.requests = {}
+        self.set_program(0, sample_program())
+
+    def set_program(self, core, text):
+        with self.lock:
+            self.programs[core] = {
+                "text": text,
+                "hash": hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()[:12],
+                "loaded": time.time(),
+            }
+            self.running.pop(core, None)
+
+    def option(self, endpoint, name):
+        return self.config["endpoints"].get(endpoint, {}).get(name, self.config[name])
+
+    def update_config(self, data):
+        with self.lock:
+            for key, value in data.items():
+                if key == "endpoints":
+                    self.config["endpoints"].update(value)
+                elif key in self.config:
+                    self.config[key] = value
+            return dict(self.config)
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    # --- Ответы ---
+    def servo_dynamic(self):
+        # Голова ходит по окружности, Z медленно качается
+        t = time.monotonic() - self.started
+        x, y = 150 + 100 * math.cos(t), 750 + 100 * math.sin(t)
+        noise = self.random.uniform(-0.002, 0.002)
+        return [
+            {},
+            {"position": x, "velocity": -100 * math.sin(t), "following_error": noise},
+            {"position": y, "velocity": 100 * math.cos(t), "following_error": -noise},
+            {"position": 15 + 5 * math.sin(t / 5), "velocity": math.cos(t / 5), "following_error": 0.0},
+        ]
+
+    def gcore_state(self, core):
+        run = self.running.get(core)
+        if run is None:
+            return "idle"
+        return "running" if time.time() - run < 10 else "done"
+
+    def laser_power(self):
+        return 80.0 if any(self.gcore_state(core) == "running" for core in self.running) else 0.0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    sim = None  # Simulator, задаётся в serve()
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body, content_type="text/plain; charset=utf-8"):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, obj, status=200):
+        self.send(status, json.dumps(obj), "application/json")
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def handle_method(self, method):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+
+        if path == "/_sim/config":
+            if method == "POST":
+                data = json.loads(self.read_body() or b"{}")
+                return self.send_json(self.sim.update_config(data))
+            return self.send_json(dict(self.sim.config, requests=self.sim.requests))
+
+        for route_method, pattern, endpoint in ROUTES:
+            m = pattern.match(path)
+            if m and route_method == method:
+                break
+        else:
+            if method in ("POST", "PUT"):
+                self.read_body()
+            return self.send(404, "Not found")
+
+        body = self.read_body() if method in ("POST", "PUT") else b""
+        self.sim.count(endpoint)
+        if self.inject(endpoint):
+            return
+        return self.respond(endpoint, method, m, body, parse_qs(url.query))
+
+    def inject(self, endpoint):
+        """Задержка и отказы; True — ответ уже отправлен (или соединение оборвано)"""
+        sim = self.sim
+        delay = sim.option(endpoint, "latency") + sim.random.uniform(0, sim.option(endpoint, "jitter"))
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        roll = sim.random.random()
+        drop, hang, fail = (sim.option(endpoint, "drop_rate"), sim.option(endpoint, "hang_rate"),
+                            sim.option(endpoint, "fail_rate"))
+        if roll < drop:
+            self.close_connection = True
+            self.connection.close()
+            return True
+        if roll < drop + hang:
+            time.sleep(sim.option(endpoint, "hang"))
+        elif roll < drop + hang + fail:
+            self.send(503, "Simulated failure")
+            return True
+        return False
+
+    def respond(self, endpoint, method, m, body, query):
+        sim = self.sim
+        if endpoint == "servo_dynamic":
+            return self.send_json(sim.servo_dynamic())
+        if endpoint == "listing":
+            program = sim.programs.get(int(m.group(1)))
+            return self.send(200, program["text"] if program else "")
+        if endpoint == "upload":
+            sim.set_program(int(m.group(1)), body.decode("utf-8", "replace"))
+            return self.send_json({"success": True, "bytes": len(body)})
+        if endpoint == "execute":
+            core = int(m.group(1))
+            if core not in sim.programs:
+                return self.send(409, "No program loaded")
+            sim.running[core] = time.time()
+            return self.send(200, "started")
+        if endpoint == "loadresult":
+            program = sim.programs.get(int(m.group(1)))
+            return self.send(200, json.dumps({"hash": program["hash"], "loaded": program["loaded"]})
+                             if program else "")
+        if endpoint == "gcore_state":
+            return self.send_json(sim.gcore_state(int(m.group(1))))
+        if endpoint == "laser_power":
+            return self.send_json(sim.laser_power())
+        if endpoint == "cut_settings_schema":
+            return self.send_json(sim.schema)
+        if endpoint == "cut_settings":
+            if method == "PUT":
+                with sim.lock:
+                    sim.settings = {"result": json.loads(body or b"{}")}
+                return self.send_json({"success": True})
+            if method == "DELETE":
+                with sim.lock:
+                    sim.settings = {"result": {}}
+                return self.send_json({"success": True})
+            return self.send_json(sim.settings)
+        return self.send(404, "Not found")
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_DELETE(self):
+        self.handle_method("DELETE")
+
+
+def serve(host="127.0.0.1", port=18080, background=False, **options):
+    """Запускает симулятор; background=True — в фоновом потоке, возвращает сервер"""
+    handler = type("SimHandler", (Handler,), {"sim": Simulator(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return server
+
+
+def parse_endpoint_options(items):
+    """["listing:latency=200", "upload:fail_rate=0.1"] -> {"listing": {"latency": 200.0}, ...}"""
+    result = {}
+    for item in items or []:
+        endpoint, _, assignment = item.partition(":")
+        key, _, value = assignment.partition("=")
+        result.setdefault(endpoint, {})[key] = float(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="базовая задержка, мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, мс")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="доля обрывов соединения")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="доля зависших запросов")
+    parser.add_argument("--hang", type=float, default=30.0, help="сколько висит зависший запрос, с")
+    parser.add_argument("--endpoint", action="append", metavar="NAME:KEY=VALUE",
+                        help="настройка одного эндпоинта, например listing:latency=200")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    print(f"Controller simulator on http://{args.host}:{args.port}")
+    serve(args.host, args.port, latency=args.latency, jitter=args.jitter,
+          fail_rate=args.fail_rate, drop_rate=args.drop_rate, hang_rate=args.hang_rate,
+          hang=args.hang, per_endpoint=parse_endpoint_options(args.endpoint), seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
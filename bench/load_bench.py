@@ -0,0 +1,207 @@
+"""
+Нагрузочный тест сервера: HTTP-клиенты и SocketIO-клиенты телеметрии одновременно.
+
+Отчёт: пропускная способность и p50/p99 по каждому маршруту, ошибки,
+частота и интервалы кадров телеметрии, память процесса сервера.
+
+Запуск из корня проекта против уже запущенного сервера:
+    python -m bench.load_bench --url http://127.0.0.1:5005 --duration 20 --app-pid <pid>
+Или с симулятором контроллера и сервером, поднятыми самим тестом:
+    python -m bench.load_bench --spawn --sim-latency 5 --sim-jitter 5 --sim-fail-rate 0.01
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+
+import requests
+import socketio
+
+
+# Смесь запросов HMI: (вес, метод, путь)
+DEFAULT_MIX = [
+    (20, "GET", "/api/loadresult"),
+    (15, "GET", "/api/listing?from=0&to=200"),
+    (15, "GET", "/api/cut-settings"),
+    (5, "GET", "/api/cut-settings-schema"),
+    (10, "GET", "/db/listpresets?limit=50"),
+    (10, "GET", "/api/get_functions"),
+    (10, "GET", "/api/telemetry/history?max_points=500"),
+    (10, "GET", "/"),
+    (5, "GET", "/api/controller/stats"),
+]
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def rss_bytes(pid):
+    """Резидентная память процесса (Linux /proc, иначе psutil, если есть)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+# --- Нагрузка ---
+def http_worker(n, url, mix, deadline, results):
+    rng = random.Random(n)
+    weights = [w for w, _, _ in mix]
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        _, method, path = rng.choices(mix, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = session.request(method, url + path, timeout=30).status_code
+        except requests.RequestException:
+            status = None
+        results.setdefault(path, []).append((time.perf_counter() - started, status))
+
+
+def socket_worker(n, url, deadline, events, connected):
+    client = socketio.Client(reconnection=False)
+    arrivals = events[n] = []
+    client.on("machine_data", lambda data: arrivals.append(time.monotonic()))
+    try:
+        client.connect(url, transports=["websocket"])
+    except Exception as e:
+        print(f"  socket {n}: {e}")
+        return
+    connected.append(n)
+    while time.monotonic() < deadline:
+        eventlet.sleep(0.2)
+    client.disconnect()
+
+
+def memory_sampler(pid, deadline, samples):
+    while time.monotonic() < deadline:
+        rss = rss_bytes(pid)
+        if rss:
+            samples.append(rss)
+        eventlet.sleep(0.5)
+
+
+def run(url, duration, http_clients, socket_clients, pid=None, mix=None):
+    mix = mix or DEFAULT_MIX
+    deadline = time.monotonic() + duration
+    results, events, connected, memory = {}, {}, [], []
+
+    pool = eventlet.GreenPool(http_clients + socket_clients + 1)
+    if pid:
+        memory.append(rss_bytes(pid) or 0)
+        pool.spawn(memory_sampler, pid, deadline, memory)
+    for n in range(socket_clients):
+        pool.spawn(socket_worker, n, url, deadline, events, connected)
+    for n in range(http_clients):
+        pool.spawn(http_worker, n, url, mix, deadline, results)
+    started = time.monotonic()
+    pool.waitall()
+    elapsed = time.monotonic() - started
+    return elapsed, results, events, connected, memory
+
+
+def report(elapsed, results, events, connected, memory):
+    total = sum(len(v) for v in results.values())
+    errors = sum(1 for v in results.values() for _, status in v if status is None or status >= 500)
+    print(f"HTTP: {total} запросов за {elapsed:.1f} с — {total / elapsed:.0f} req/s, ошибок {errors}")
+    for path, values in sorted(results.items(), key=lambda item: -len(item[1])):
+        latencies = [latency for latency, _ in values]
+        failed = sum(1 for _, status in values if status is None or status >= 500)
+        print(f"  {path:42s} n={len(values):6d} {len(values) / elapsed:7.0f}/s  "
+              f"p50={percentile(latencies, 0.5) * 1000:7.2f} мс  "
+              f"p99={percentile(latencies, 0.99) * 1000:7.2f} мс  err={failed}")
+
+    if events:
+        frames = sum(len(v) for v in events.values())
+        gaps = [b - a for v in events.values() for a, b in zip(v, v[1:])]
+        print(f"SocketIO: подключено {len(connected)}/{len(events)}, кадров {frames} "
+              f"({frames / elapsed / max(len(connected), 1):.1f}/с на клиента), "
+              f"интервал p50={percentile(gaps, 0.5) * 1000:.1f} мс p99={percentile(gaps, 0.99) * 1000:.1f} мс")
+
+    if memory:
+        mb = 1024 * 1024
+        print(f"Память сервера: старт {memory[0] / mb:.1f} МБ, пик {max(memory) / mb:.1f} МБ, "
+              f"конец {memory[-1] / mb:.1f} МБ")
+
+
+# --- Запуск симулятора и сервера ---
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            eventlet.sleep(0.2)
+    return False
+
+
+def spawn(args):
+    sim_url = f"http://127.0.0.1:{args.sim_port}"
+    sim = subprocess.Popen(
+        [sys.executable, "-m", "bench.controller_sim", "--port", str(args.sim_port),
+         "--latency", str(args.sim_latency), "--jitter", str(args.sim_jitter),
+         "--fail-rate", str(args.sim_fail_rate)],
+        cwd=PROJECT_DIR, stdout=subprocess.DEVNULL)
+    if not wait_ready(sim_url + "/_sim/config"):
+        sim.terminate()
+        raise SystemExit("Симулятор контроллера не запустился")
+
+    env = dict(os.environ, SALASERV_EXTERNAL_API=sim_url)
+    app = subprocess.Popen([sys.executable, "app.py"], cwd=PROJECT_DIR, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_ready(args.url + "/metrics"):
+        app.terminate()
+        sim.terminate()
+        raise SystemExit("Сервер не запустился")
+    return sim, app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5005")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--http-clients", type=int, default=20)
+    parser.add_argument("--socket-clients", type=int, default=10)
+    parser.add_argument("--app-pid", type=int, help="PID сервера для замера памяти")
+    parser.add_argument("--spawn", action="store_true", help="поднять симулятор и сервер самим")
+    parser.add_argument("--sim-port", type=int, default=18080)
+    parser.add_argument("--sim-latency", type=float, default=5.0)
+    parser.add_argument("--sim-jitter", type=float, default=5.0)
+    parser.add_argument("--sim-fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes = []
+    pid = args.app_pid
+    if args.spawn:
+        processes = spawn(args)
+        pid = processes[1].pid
+    try:
+        report(*run(args.url.rstrip("/"), args.duration, args.http_clients, args.socket_clients, pid))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк базы пресетов: list/get/save под конкурентными eventlet-клиентами.
+
+Сравнивает прежнюю схему (новое соединение на каждый запрос, rollback journal)
+с пулом соединений api.db (WAL, pragma, кэш запросов).
+
+Запуск из корня проекта:
+    python -m bench.presets_bench --clients 20 --ops 200 --presets 2000
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import config
+from api import db
+
+
+SAMPLE_PRESET = {
+    "name": "bench",
+    "material": {"name": "St37", "thickness": 3.0},
+    "technology": {"macros": [{"power": 80, "speed": 2500, "gas": "O2", "pressure": 0.6}] * 8},
+}
+
+
+@contextmanager
+def legacy_connect():
+    """Как было: отдельное соединение на каждый запрос, настройки по умолчанию"""
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def prepare(path, presets):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    db.DB_PATH = path
+    from api import presets as presets_module
+    presets_module.init_db()
+    db.close_all()
+    client = make_client()
+    for i in range(presets):
+        data = dict(SAMPLE_PRESET, material={"name": f"M{i % 20}", "thickness": 1 + i % 15})
+        client.post("/db/savepreset", json=data)
+    return client
+
+
+def make_client():
+    from flask import Flask
+    from api.presets import preset_bp
+    app = Flask(__name__)
+    app.register_blueprint(preset_bp, url_prefix="/db")
+    return app.test_client()
+
+
+def run(client, clients, ops):
+    """Каждый клиент выполняет ops операций: 70% get, 20% list, 10% save"""
+    latencies = {"list": [], "get": [], "save": []}
+
+    def worker(n):
+        for i in range(ops):
+            k = (n * ops + i) % 10
+            started = time.perf_counter()
+            if k < 7:
+                kind = "get"
+                client.get(f"/db/get_preset?id={1 + (n + i) % 50}")
+            elif k < 9:
+                kind = "list"
+                client.get("/db/listpresets")
+            else:
+                kind = "save"
+                client.post("/db/savepreset", json=SAMPLE_PRESET)
+            latencies[kind].append(time.perf_counter() - started)
+            eventlet.sleep(0)
+
+    pool = eventlet.GreenPool(clients)
+    started = time.perf_counter()
+    for n in range(clients):
+        pool.spawn(worker, n)
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+    return elapsed, latencies
+
+
+def report(title, elapsed, latencies):
+    total = sum(len(v) for v in latencies.values())
+    print(f"{title}: {total} ops за {elapsed:.2f} с — {total / elapsed:.0f} ops/s")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        p50 = values[len(values) // 2] * 1000
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+        print(f"  {kind:5s} n={len(values):6d} {len(values) / elapsed:8.0f}/s  p50={p50:.2f} мс  p99={p99:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=200)
+    parser.add_argument("--presets", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="presets_bench_")
+    original_connect = db.connect
+
+    # --- Было ---
+    db.connect = legacy_connect
+    client = prepare(os.path.join(workdir, "legacy.db"), args.presets)
+    report("before (connect per request)", *run(client, args.clients, args.ops))
+
+    # --- Стало ---
+    db.connect = original_connect
+    client = prepare(os.path.join(workdir, "pooled.db"), args.presets)
+    report(f"after (pool={config.DB_POOL_SIZE}, WAL)", *run(client, args.clients, args.ops))
+    db.close_all()
+
+
+if __name__ == "__main__":
+    main()
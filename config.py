@@ -1,4 +1,5 @@
 import os
+import json
 
 # Базовые настройки
 DEBUG = True
@@ -7,5 +8,208 @@ SECRET_KEY = "super-secret-key"
 # Пути
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Внешний API
-EXTERNAL_API = "http://192.168.11.10"
+# Внешний API (SALASERV_EXTERNAL_API — например, симулятор bench.controller_sim)
+EXTERNAL_API = os.environ.get("SALASERV_EXTERNAL_API", "http://192.168.11.10")
+
+# --- Станки ---
+# id -> адрес контроллера, имя и номера gcore. У каждого станка свой пул соединений,
+# кэши, опрос телеметрии и SocketIO-namespace "/m/<id>", маршруты — /api/m/<id>/...
+# Без "gcores" станок принимает любой gcore из запроса (как прежние маршруты),
+# а телеметрия опрашивает gcore 0
+# Станок DEFAULT_MACHINE обслуживает и прежние маршруты без /m/<id>, и namespace "/"
+# SALASERV_MACHINES — тот же словарь в JSON, SALASERV_DEFAULT_MACHINE — его id по умолчанию
+MACHINES = json.loads(os.environ["SALASERV_MACHINES"]) if os.environ.get("SALASERV_MACHINES") else {
+    "default": {"url": EXTERNAL_API, "name": "Laser"},
+}
+DEFAULT_MACHINE = os.environ.get("SALASERV_DEFAULT_MACHINE", "default")
+
+# --- Соединение с контроллером ---
+# Размер пула keep-alive соединений к EXTERNAL_API
+CONTROLLER_POOL_SIZE = 10
+# Если пул исчерпан — ждать свободное соединение, а не открывать новое
+CONTROLLER_POOL_BLOCK = True
+
+# Таймауты (сек) по эндпоинтам; "default" — для всех остальных
+CONTROLLER_TIMEOUTS = {
+    "default": 5,
+    "servo_dynamic": 1,
+    "loadresult": 5,
+    "listing": 5,
+    "upload": 10,
+    "execute": 5,
+    "cut_settings": 5,
+    "cut_settings_schema": 5,
+    "health": 1,
+}
+
+# Повторы при сетевых ошибках и 502/503/504: число повторов и базовая
+# задержка backoff (сек), удваивается с каждой попыткой.
+# Не повторяем неидемпотентные вызовы (upload, execute).
+CONTROLLER_RETRIES = {
+    "default": {"retries": 0, "backoff": 0.1},
+    "loadresult": {"retries": 2, "backoff": 0.1},
+    "listing": {"retries": 2, "backoff": 0.2},
+    "cut_settings_schema": {"retries": 2, "backoff": 0.2},
+}
+
+# Предохранитель (circuit breaker): после failures подряд запросов, завершившихся
+# сетевой ошибкой/таймаутом (после всех повторов; ответы 5xx не считаются),
+# запросы к контроллеру сразу получают 503, а фоновая проверка стучится
+# в health_path с паузой от backoff до backoff_max (сек), удваивая её
+CONTROLLER_BREAKER = {"failures": 3, "backoff": 1.0, "backoff_max": 30.0}
+CONTROLLER_HEALTH_PATH = "/servo/dynamic"
+
+# --- Загрузка G-code ---
+# Максимальный размер программы (байт), больше — 413 без передачи на станок
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+# Размер куска при потоковой передаче на контроллер
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Как часто (байт) отправлять событие upload_progress по SocketIO
+UPLOAD_PROGRESS_STEP = 512 * 1024
+
+# --- Анализ G-code и превью траектории ---
+# Допуск прореживания траектории при загрузке (мм); запросом можно только огрубить
+GCODE_PREVIEW_TOLERANCE = 0.05
+# Для оценки времени: скорость холостых ходов и подача по умолчанию (мм/мин),
+# время одной пробивки (сек)
+GCODE_RAPID_SPEED = 30000
+GCODE_DEFAULT_FEED = 3000
+GCODE_PIERCE_TIME = 0.5
+# M-коды включения и выключения луча (включение — пробивка)
+GCODE_LASER_ON = (3, 4)
+GCODE_LASER_OFF = (5,)
+# Программы больше этого размера на станок уходят, но не разбираются
+GCODE_ANALYZE_MAX_BYTES = 50 * 1024 * 1024
+# Разбор готового текста (listing) кусками этого размера, между ними — переключение green-потоков
+GCODE_ANALYZE_CHUNK = 64 * 1024
+# Кэш превью по хэшу программы: число программ и суммарный размер массивов (байт)
+GCODE_PREVIEW_CACHE_ENTRIES = 16
+GCODE_PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+# --- Кэш G-code listing ---
+# Через сколько секунд перепроверять listing на контроллере (None — только по смене программы)
+LISTING_CACHE_TTL = 30
+
+# --- Телеметрия ---
+# Частота опроса и рассылки по умолчанию (Гц)
+TELEMETRY_RATE_HZ = 20
+# Порог изменения по осям (мм), меньшие изменения не рассылаются
+TELEMETRY_DEADBAND = {"default": 0.01}
+# Раз в сколько секунд рассылать кадр, даже если ничего не изменилось
+TELEMETRY_KEYFRAME_INTERVAL = 2.0
+# Сколько неотправленных пакетов в очереди клиента считаем отставанием:
+# такой клиент получает только последнее состояние, без очереди кадров
+TELEMETRY_MAX_BACKLOG = 2
+
+# Ресурсы контроллера для телеметрии; опрашиваются, только пока есть подписчики.
+# Путь с {gcore} — ресурс на каждый gcore станка (например, "/py/gcores[{gcore}].<поле>"
+# даёт ресурсы "<имя>:0", "<имя>:1"); каналы на нём тоже по gcore ("<канал>:1",
+# событие "telemetry.<канал>:1"), канал без номера — первый gcore станка.
+# Мощность лазера и состояние gcore добавить сюда, когда будут известны пути прошивки
+TELEMETRY_RESOURCES = {
+    "servo_dynamic": "/servo/dynamic",
+}
+# Индексы осей в ответе /servo/dynamic
+TELEMETRY_AXES = {1: "X", 2: "Y", 3: "Z"}
+# Каналы телеметрии: клиент подписывается событием subscribe {"channels": [...]}
+#   field — поле оси из servo_dynamic; name — имя значения для скалярных ресурсов
+#   event — имя события SocketIO (по умолчанию "telemetry.<канал>")
+#   rate_hz, deadband, precision — частота, порог и округление значений
+#   deltas — кадры только с изменившимися осями (клиент объединяет их по name);
+#            machine_data всегда полный: HMI заменяет им список осей целиком
+TELEMETRY_CHANNELS = {
+    "positions": {"resource": "servo_dynamic", "field": "position", "measure": "mm",
+                  "event": "machine_data"},
+    "velocities": {"resource": "servo_dynamic", "field": "velocity", "measure": "mm/s",
+                   "rate_hz": 10, "deltas": True},
+    "following_error": {"resource": "servo_dynamic", "field": "following_error", "measure": "mm",
+                        "rate_hz": 50, "precision": 3, "deadband": {"default": 0.001}, "deltas": True},
+}
+# Каналы, на которые клиент подписан сразу после подключения
+TELEMETRY_DEFAULT_CHANNELS = ["positions"]
+# Пауза опроса ресурса без подписчиков (сек)
+TELEMETRY_IDLE_SLEEP = 0.25
+# История положений осей: канал-источник и размер кольцевого буфера (отсчётов);
+# 6000 отсчётов при 20 Гц — последние 5 минут
+TELEMETRY_HISTORY_CHANNEL = "positions"
+TELEMETRY_HISTORY_SIZE = 6000
+# Сколько точек истории отдавать максимум и по умолчанию
+TELEMETRY_HISTORY_MAX_POINTS = 5000
+TELEMETRY_HISTORY_DEFAULT_POINTS = 1000
+# Окно истории (сек) и число точек, которые новый клиент получает сразу после подключения
+TELEMETRY_HISTORY_WINDOW = 30
+TELEMETRY_HISTORY_WINDOW_POINTS = 300
+
+# --- База пресетов (SQLite) ---
+DB_PATH = "preset.db"
+# Постоянные соединения в пуле
+DB_POOL_SIZE = 4
+# Сколько ждать свободного соединения (сек), дальше — 503
+DB_POOL_TIMEOUT = 5
+# Ожидание блокировки базы (мс) вместо мгновенного "database is locked"
+DB_BUSY_TIMEOUT_MS = 5000
+# Кэш страниц на соединение (КБ) и кэш подготовленных запросов
+DB_CACHE_SIZE_KB = 8192
+DB_STATEMENT_CACHE = 128
+# NORMAL в режиме WAL — без fsync на каждый commit, целостность сохраняется
+DB_SYNCHRONOUS = "NORMAL"
+# Размер страницы /db/listpresets по умолчанию и максимальный
+PRESETS_PAGE_SIZE = 50
+PRESETS_PAGE_MAX = 500
+# Кэш разобранных пресетов: максимум записей и суммарный размер JSON (байт)
+PRESET_CACHE_ENTRIES = 256
+PRESET_CACHE_BYTES = 16 * 1024 * 1024
+# Импорт/экспорт пресетов NDJSON: строк в одной транзакции, строк за одну выборку,
+# сколько ошибок по строкам возвращать в ответе
+PRESET_IMPORT_BATCH = 500
+PRESET_EXPORT_FETCH = 200
+PRESET_IMPORT_MAX_ERRORS = 100
+
+# --- Кэш ответов контроллера ---
+# ttl — сколько секунд ответ свежий; stale — сколько ещё отдаём старый ответ,
+# обновляя его в фоне (stale-while-revalidate)
+PROXY_CACHE = {
+    "cut_settings_schema": {"ttl": 3600, "stale": 24 * 3600},
+    "cut_settings": {"ttl": 5, "stale": 60},
+}
+
+# --- Переводы интерфейса ---
+TRANSLATIONS_DIR = "/home/woodver/salaser/src/scripts/translations"
+# Бэкенд перевода: "google" — translate.googleapis.com, "stub" — без сети (тесты, офлайн)
+TRANSLATION_BACKEND = "google"
+TRANSLATION_TIMEOUT = 5
+# Сколько переводов выполнять параллельно
+TRANSLATION_WORKERS = 8
+# Память переводов: уже переведённые фразы не запрашиваются повторно
+TRANSLATION_MEMORY_FILE = os.path.join(BASE_DIR, "translation_memory.json")
+# Как часто (сек) проверять mtime tsx-файлов для перезагрузки индекса переводов
+TRANSLATIONS_CHECK_INTERVAL = 1.0
+
+# --- Статика интерфейса (templates/laserMain) ---
+STATIC_DIR = os.path.join(BASE_DIR, "templates", "laserMain")
+# Файлы сборки с хэшем в имени (index-D9l2UR4L.js) не меняются — кэшируем навсегда
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Каталог сборки Vite (относительно STATIC_DIR): только его файлы с хэшем в имени неизменяемы
+STATIC_HASHED_DIR = "assets"
+# index.html всегда перепроверяется по ETag, иначе браузер не увидит новую сборку
+STATIC_INDEX_MAX_AGE = 0
+# Остальные файлы (картинки)
+STATIC_DEFAULT_MAX_AGE = 3600
+# Что сжимать заранее (gzip, и brotli, если установлен модуль brotli)
+STATIC_COMPRESS_EXTENSIONS = (".js", ".css", ".html", ".svg", ".json", ".ttf", ".otf", ".map", ".txt")
+STATIC_COMPRESS_MIN_SIZE = 1024
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+
+# --- Метрики (/metrics, формат Prometheus) ---
+# Границы корзин гистограмм времени (сек)
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Как часто (сек) мерить задержку цикла eventlet
+METRICS_LOOP_LAG_INTERVAL = 0.5
+# Семплирующий профилировщик (включается POST /metrics/profiler): период (сек CPU)
+# и предел числа разных стеков, чтобы память не росла
+METRICS_PROFILER_INTERVAL = 0.005
+# Допустимый период из запроса (сек): чаще 1 мс сам профилировщик грузит процессор
+METRICS_PROFILER_INTERVAL_MIN = 0.001
+METRICS_PROFILER_INTERVAL_MAX = 1.0
+METRICS_PROFILER_MAX_STACKS = 5000
@@ -0,0 +1,278 @@
+import re
+import sys
+import time
+import signal
+import threading
+from functools import lru_cache
+import config
+
+
+# Метрики в текстовом формате Prometheus (без prometheus_client)
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _labels(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._labels(labels), value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name} {format_value(value)}" for name, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), func=None):
+        super().__init__(name, help, labelnames)
+        self.func = func  # func() -> значение без меток, считается при выдаче
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.func is not None:
+            return [(self.name, self.func())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=None):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets or config.METRICS_LATENCY_BUCKETS)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._values.items()]
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                result.append((self.name + "_bucket" + self._labels(labels, ("le", format_value(bound))), cumulative))
+            result.append((self.name + "_bucket" + self._labels(labels, ("le", "+Inf")), count))
+            result.append((self.name + "_sum" + self._labels(labels), total))
+            result.append((self.name + "_count" + self._labels(labels), count))
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(round(value, 6))
+    return str(value)
+
+
+registry = []
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Метрики ---
+http_request_seconds = Histogram(
+    "salaserv_http_request_seconds", "Время обработки HTTP-запроса",
+    ("blueprint", "route", "method"))
+http_requests_total = Counter(
+    "salaserv_http_requests_total", "HTTP-запросы по маршрутам и статусам",
+    ("blueprint", "route", "method", "status"))
+
+controller_request_seconds = Histogram(
+    "salaserv_controller_request_seconds", "Время запроса к контроллеру станка", ("machine", "endpoint"))
+controller_errors_total = Counter(
+    "salaserv_controller_errors_total", "Сетевые ошибки и ответы 5xx контроллера", ("machine", "endpoint"))
+controller_retries_total = Counter(
+    "salaserv_controller_retries_total", "Повторные запросы к контроллеру", ("machine", "endpoint"))
+controller_fast_fail_total = Counter(
+    "salaserv_controller_fast_fail_total", "Запросы, отклонённые разомкнутым предохранителем",
+    ("machine", "endpoint"))
+controller_available = Gauge(
+    "salaserv_controller_available", "1 — предохранитель замкнут, 0 — контроллер считается недоступным",
+    ("machine",))
+
+sqlite_query_seconds = Histogram(
+    "salaserv_sqlite_query_seconds", "Время выполнения SQL-запроса", ("statement",))
+sqlite_transaction_seconds = Histogram(
+    "salaserv_sqlite_transaction_seconds", "Время блока db.connect() от получения соединения до commit")
+
+socketio_clients = Gauge("salaserv_socketio_clients", "Подключённые клиенты SocketIO", ("namespace",))
+socketio_emit_seconds = Histogram(
+    "salaserv_socketio_emit_seconds", "Время рассылки одного кадра телеметрии всем клиентам", ("event",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+loop_lag_seconds = Histogram(
+    "salaserv_event_loop_lag_seconds", "Задержка пробуждения таска eventlet сверх запрошенного sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+loop_lag_last = Gauge("salaserv_event_loop_lag_last_seconds", "Последняя измеренная задержка цикла eventlet")
+
+
+# --- SQL ---
+STATEMENT_RE = re.compile(
+    r"^\s*(\w+)(?:.*?\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+))?", re.I | re.S)
+
+
+@lru_cache(maxsize=256)
+def statement_label(sql):
+    """Метка запроса: операция и таблица ("select presets"), без параметров"""
+    m = STATEMENT_RE.match(sql)
+    if not m:
+        return "other"
+    op = m.group(1).lower()
+    if op == "pragma":
+        return "pragma"
+    if op == "update":
+        return f"update {sql.split()[1]}"
+    return f"{op} {m.group(2)}" if m.group(2) else op
+
+
+# --- Цикл eventlet ---
+def monitor_loop_lag(sleep, interval=None):
+    """
+    Фоновый таск: засыпает на interval и меряет, насколько позже проснулся.
+    Большая задержка — кто-то блокирует хаб eventlet.
+    """
+    interval = interval or config.METRICS_LOOP_LAG_INTERVAL
+    while True:
+        started = time.monotonic()
+        sleep(interval)
+        lag = max(time.monotonic() - started - interval, 0.0)
+        loop_lag_seconds.observe(lag)
+        loop_lag_last.set(lag)
+
+
+# --- Профилировщик ---
+class SamplingProfiler:
+    """
+    Семплирующий профилировщик по SIGPROF: раз в interval секунд процессорного
+    времени запоминает стек прерванного кода. Все гринлеты eventlet работают
+    в главном потоке, поэтому сигнал попадает в тот, что сейчас занимает CPU.
+    Результат — свёрнутые стеки (формат flamegraph.pl / speedscope).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = None
+        self.started_at = None
+        self.samples = 0
+        self.stacks = {}
+
+    def _handler(self, signum, frame):
+        parts = []
+        while frame is not None and len(parts) < 64:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+            frame = frame.f_back
+        key = ";".join(reversed(parts))
+        if key in self.stacks or len(self.stacks) < config.METRICS_PROFILER_MAX_STACKS:
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def start(self, interval=None):
+        """Только из главного потока (ограничение signal)"""
+        if self.enabled:
+            return
+        self.interval = interval or config.METRICS_PROFILER_INTERVAL
+        self.stacks = {}
+        self.samples = 0
+        signal.signal(signal.SIGPROF, self._handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.started_at = time.time()
+        self.enabled = True
+
+    def stop(self):
+        if not self.enabled:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self.enabled = False
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "interval": self.interval,
+            "started_at": self.started_at,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "supported": hasattr(signal, "setitimer") and sys.platform != "win32",
+        }
+
+    def collapsed(self):
+        stacks = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,166 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+from email.utils import formatdate
+from flask import Response, request, abort
+from werkzeug.security import safe_join
+import config
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него отдаём только gzip
+    brotli = None
+
+
+# Имя файла сборки Vite с хэшем содержимого: index-D9l2UR4L.js, DSEG7Modern-Italic-CQpIQWfv.ttf.
+# Проверяется только в каталоге сборки (config.STATIC_HASHED_DIR): laser-settings.js
+# в другом месте — обычный файл, а не неизменяемый
+HASHED_RE = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+# Порядок предпочтения кодировок, если браузер принимает несколько
+ENCODINGS = ("br", "gzip")
+
+
+class Asset:
+    """Файл статики в памяти вместе с заранее сжатыми вариантами"""
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+        self.mtime = stat.st_mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.etag = hashlib.sha1(self.data).hexdigest()[:20]
+        # encoding -> сжатые байты
+        self.variants = {}
+
+    def compress(self):
+        if not self.path.lower().endswith(config.STATIC_COMPRESS_EXTENSIONS):
+            return
+        if len(self.data) < config.STATIC_COMPRESS_MIN_SIZE:
+            return
+
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            # Вариант, собранный при сборке фронта, если он не старее исходника
+            prebuilt = self.path + suffix
+            if os.path.exists(prebuilt) and os.stat(prebuilt).st_mtime >= self.mtime:
+                with open(prebuilt, "rb") as f:
+                    self.variants[encoding] = f.read()
+                continue
+            if encoding == "br":
+                if brotli is not None:
+                    self.variants["br"] = brotli.compress(self.data, quality=config.STATIC_BROTLI_QUALITY)
+            else:
+                self.variants["gzip"] = gzip.compress(self.data, config.STATIC_GZIP_LEVEL, mtime=0)
+
+        # Сжатие, которое ничего не дало, не держим
+        for encoding in list(self.variants):
+            if len(self.variants[encoding]) >= len(self.data):
+                del self.variants[encoding]
+
+
+class StaticAssets:
+    """
+    Отдача собранного интерфейса из памяти:
+    хэшированные файлы — immutable, index.html — с перепроверкой по ETag,
+    gzip/brotli выбираются по Accept-Encoding, поддерживаются Range и 304.
+    Файл перечитывается, только если сменились его mtime или размер.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """Читает и сжимает всю статику заранее, чтобы первый заход не ждал сжатия"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith((".gz", ".br")):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, name), self.root)
+                self.get(rel.replace(os.sep, "/"))
+
+    def get(self, filename):
+        """Asset или None, если файла нет"""
+        path = safe_join(self.root, filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        asset = self._assets.get(filename)
+        if asset is not None and asset.stat == (stat.st_mtime_ns, stat.st_size):
+            return asset
+
+        with self._lock:
+            asset = self._assets.get(filename)
+            if asset is None or asset.stat != (stat.st_mtime_ns, stat.st_size):
+                asset = Asset(path, stat)
+                asset.compress()
+                self._assets[filename] = asset
+        return asset
+
+    @staticmethod
+    def is_hashed(filename):
+        """Файл сборки Vite с хэшем в имени: его содержимое под этим именем не меняется"""
+        directory, _, name = filename.replace("\\", "/").rpartition("/")
+        return directory == config.STATIC_HASHED_DIR and bool(HASHED_RE.search(name))
+
+    def cache_control(self, filename):
+        name = os.path.basename(filename)
+        if name == "index.html":
+            max_age = config.STATIC_INDEX_MAX_AGE
+            return f"public, max-age={max_age}, must-revalidate" if max_age else "no-cache"
+        if self.is_hashed(filename):
+            return f"public, max-age={config.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        return f"public, max-age={config.STATIC_DEFAULT_MAX_AGE}"
+
+    def choose_encoding(self, asset):
+        # Диапазоны отдаём по несжатому файлу: иначе Range относился бы к сжатым байтам
+        if not asset.variants or request.range is not None:
+            return None
+        accepted = request.accept_encodings
+        for encoding in ENCODINGS:
+            if encoding in asset.variants and accepted.quality(encoding) > 0:
+                return encoding
+        return None
+
+    def serve(self, filename):
+        asset = self.get(filename)
+        if asset is None:
+            abort(404)
+
+        encoding = self.choose_encoding(asset)
+        data = asset.variants[encoding] if encoding else asset.data
+
+        resp = Response(data, mimetype=asset.mimetype)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if asset.variants:
+            resp.headers["Vary"] = "Accept-Encoding"
+        # У каждого варианта свой ETag: байты разные
+        resp.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        resp.headers["Last-Modified"] = formatdate(asset.mtime, usegmt=True)
+        resp.headers["Cache-Control"] = self.cache_control(filename)
+        return resp.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+    def stats(self):
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(a.data) for a in self._assets.values()),
+            "compressed_bytes": {
+                encoding: sum(len(a.variants[encoding]) for a in self._assets.values() if encoding in a.variants)
+                for encoding in ENCODINGS
+            },
+            "brotli": brotli is not None,
+        }
@@ -0,0 +1,390 @@
+import time
+import bisect
+import threading
+from array import array
+import config
+import metrics
+
+
+NAN = float("nan")
+
+
+class TelemetryEngine:
+    """
+    Рассылка телеметрии по изменениям.
+    Кадр — список осей {"name", "measure", "val"}. Порог (deadband) решает только,
+    отправлять ли кадр: кадр всегда содержит все оси, клиент (HMI) заменяет им
+    прежний список целиком. Раз в keyframe_interval кадр уходит и без изменений.
+    deltas=True — промежуточные кадры только с изменившимися осями, клиент
+    объединяет их по name (для новых событий telemetry.*, не для machine_data).
+    Отстающим клиентам кадры не копятся в очереди: изменения сливаются
+    и уходят одним кадром, когда клиент догонит.
+    """
+
+    def __init__(self, socketio, event="machine_data", rate_hz=None, deadband=None,
+                 keyframe_interval=None, max_backlog=None, namespace="/", room=None, deltas=False):
+        self.socketio = socketio
+        self.event = event
+        self.deltas = deltas
+        self.namespace = namespace
+        self.room = room  # None — рассылка всем подключённым
+        self.rate_hz = rate_hz or config.TELEMETRY_RATE_HZ
+        self.deadband = deadband if deadband is not None else config.TELEMETRY_DEADBAND
+        self.keyframe_interval = keyframe_interval or config.TELEMETRY_KEYFRAME_INTERVAL
+        self.max_backlog = config.TELEMETRY_MAX_BACKLOG if max_backlog is None else max_backlog
+
+        self.state = {}    # name -> последняя разосланная ось
+        self.pending = {}  # sid -> {name: ось}, ещё не доставленное клиенту
+        self._last_keyframe = 0.0
+
+    # --- Клиенты ---
+    def add_client(self, sid):
+        # Новый клиент сразу получает полное состояние
+        self.pending[sid] = dict(self.state)
+
+    def remove_client(self, sid):
+        self.pending.pop(sid, None)
+
+    def _backlog(self, sid):
+        """Длина исходящей очереди engine.io для клиента"""
+        try:
+            server = self.socketio.server
+            eio_sid = server.manager.eio_sid_from_sid(sid, self.namespace)
+            sock = server.eio.sockets.get(eio_sid)
+            return sock.queue.qsize() if sock else 0
+        except Exception:
+            return 0
+
+    # --- Кадры ---
+    def _threshold(self, name):
+        return self.deadband.get(name, self.deadband.get("default", 0))
+
+    def _moved(self, name, prev, val):
+        if isinstance(val, (int, float)) and isinstance(prev, (int, float)):
+            return abs(val - prev) >= self._threshold(name)
+        # Нечисловые значения (состояние gcore) — любое изменение
+        return val != prev
+
+    def diff(self, axes):
+        """Оси, изменившиеся больше порога; обновляет разосланное состояние"""
+        changed = {}
+        for axis in axes:
+            name = axis["name"]
+            prev = self.state.get(name)
+            if prev is None or self._moved(name, prev["val"], axis["val"]):
+                self.state[name] = axis
+                changed[name] = axis
+        return changed
+
+    def tick(self, axes, now=None):
+        """Один шаг: вычисляет изменения и рассылает их клиентам"""
+        now = time.monotonic() if now is None else now
+        changed = self.diff(axes)
+
+        if now - self._last_keyframe >= self.keyframe_interval:
+            self._last_keyframe = now
+            changed = dict(self.state)
+            for pending in self.pending.values():
+                pending.clear()
+
+        if not self.pending or not changed:
+            return
+
+        with metrics.socketio_emit_seconds.time(self.event):
+            self._fan_out(changed)
+
+    def _frame(self, changed):
+        return list((changed if self.deltas else self.state).values())
+
+    def _fan_out(self, changed):
+        # Все клиенты успевают и им нечего дослать — один broadcast
+        ready = [sid for sid in list(self.pending) if self._backlog(sid) < self.max_backlog]
+        if len(ready) == len(self.pending) and not any(self.pending.values()):
+            self.socketio.emit(self.event, self._frame(changed), to=self.room, namespace=self.namespace)
+            return
+
+        for sid, pending in list(self.pending.items()):
+            pending.update(changed)
+            if pending and sid in ready:
+                self.socketio.emit(self.event, self._frame(pending), to=sid, namespace=self.namespace)
+                pending.clear()
+
+
+
+def servo_axes(field, measure, precision=2, axes=None):
+    """Извлекает поле field осей из ответа /servo/dynamic"""
+    axes = axes or config.TELEMETRY_AXES
+
+    def extract(servo_data):
+        result = []
+        for index, name in axes.items():
+            try:
+                val = servo_data[index][field]
+            except (IndexError, KeyError, TypeError):
+                continue
+            if isinstance(val, float):
+                val = round(val, precision)
+            result.append({"name": name, "measure": measure, "val": val})
+        return result
+    return extract
+
+
+def scalar(name, measure, precision=2):
+    """Ресурс с одним значением"""
+    def extract(value):
+        if isinstance(value, float):
+            value = round(value, precision)
+        return [{"name": name, "measure": measure, "val": value}]
+    return extract
+
+
+class TelemetryHistory:
+    """
+    Кольцевой буфер отсчётов осей фиксированного размера.
+    Время и значения каждой оси лежат в array("d"), память не растёт;
+    отсутствующее значение хранится как NaN и отдаётся как null.
+    """
+
+    def __init__(self, axes=None, size=None):
+        self.axes = list(axes or config.TELEMETRY_AXES.values())
+        self.size = size or config.TELEMETRY_HISTORY_SIZE
+        self.times = array("d", [0.0]) * self.size
+        self.values = {name: array("d", [NAN]) * self.size for name in self.axes}
+        self.head = 0   # куда писать следующий отсчёт
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, axes, ts=None):
+        """Отсчёт из списка осей {"name", "val"}; ts — время UNIX (сек)"""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            i = self.head
+            self.times[i] = ts
+            for column in self.values.values():
+                column[i] = NAN
+            for axis in axes:
+                column = self.values.get(axis["name"])
+                if column is not None and isinstance(axis["val"], (int, float)):
+                    column[i] = axis["val"]
+            self.head = (i + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+
+    def _ordered(self, column):
+        """Копия столбца от старых отсчётов к новым"""
+        start = (self.head - self.count) % self.size
+        if start + self.count <= self.size:
+            return column[start:start + self.count]
+        return column[start:] + column[:self.head]
+
+    def query(self, since=None, axes=None, max_points=None, method="lttb"):
+        """
+        Отсчёты новее since, прореженные до max_points.
+        method: "lttb" — Largest-Triangle-Three-Buckets по всем осям сразу,
+        "minmax" — минимум и максимум каждой оси в корзине.
+        """
+        names = [name for name in (axes or self.axes) if name in self.values]
+        with self._lock:
+            times = self._ordered(self.times)
+            columns = {name: self._ordered(self.values[name]) for name in names}
+
+        first = bisect.bisect_right(times, since) if since is not None else 0
+        if first:
+            times = times[first:]
+            columns = {name: column[first:] for name, column in columns.items()}
+
+        if max_points is None or len(times) <= max_points:
+            indices = range(len(times))
+        elif method == "minmax":
+            indices = minmax(times, columns, max_points)
+        else:
+            indices = lttb(times, columns, max_points)
+
+        return {
+            "t": [round(times[i], 3) for i in indices],
+            "axes": {name: [None if column[i] != column[i] else column[i] for i in indices]
+                     for name, column in columns.items()},
+            "count": len(times),
+            "last": times[-1] if len(times) else since,
+        }
+
+
+def lttb(times, columns, threshold):
+    """
+    Индексы отсчётов по LTTB. Площадь треугольника считается по каждой оси
+    и суммируется, чтобы у всех осей остались одни и те же моменты времени.
+    """
+    n = len(times)
+    if threshold < 3:
+        return [0, n - 1][:max(threshold, 1)]
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n)
+
+        # Средняя точка следующей корзины (последняя корзина — последний отсчёт)
+        if end >= next_end:
+            avg_t = times[n - 1]
+            avg = {name: column[n - 1] for name, column in columns.items()}
+        else:
+            avg_t = sum(times[end:next_end]) / (next_end - end)
+            avg = {}
+            for name, column in columns.items():
+                vals = [v for v in column[end:next_end] if v == v]
+                avg[name] = sum(vals) / len(vals) if vals else NAN
+
+        best, best_area = start, -1.0
+        ta = times[a]
+        for j in range(start, end):
+            area = 0.0
+            for name, column in columns.items():
+                ya, yj, yc = column[a], column[j], avg[name]
+                if ya == ya and yj == yj and yc == yc:
+                    area += abs((ta - avg_t) * (yj - ya) - (ta - times[j]) * (yc - ya))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def minmax(times, columns, threshold):
+    """Индексы минимума и максимума каждой оси в равных по числу отсчётов корзинах"""
+    n = len(times)
+    per_bucket = 2 * max(len(columns), 1)
+    buckets = max((threshold - 2) // per_bucket, 1)
+    size = n / buckets
+    selected = {0, n - 1}
+    for bucket in range(buckets):
+        lo, hi = int(bucket * size), int((bucket + 1) * size)
+        if not columns:
+            selected.add(lo)
+        for column in columns.values():
+            valid = [j for j in range(lo, hi) if column[j] == column[j]]
+            if valid:
+                selected.add(min(valid, key=column.__getitem__))
+                selected.add(max(valid, key=column.__getitem__))
+    return sorted(selected)
+
+
+class TelemetryHub:
+    """
+    Каналы телеметрии поверх комнат SocketIO.
+    Каждый ресурс контроллера опрашивается своим фоновым таском и только
+    пока хотя бы один клиент подписан на канал, который его использует.
+    Частота опроса ресурса — максимальная среди подписанных каналов.
+    """
+
+    def __init__(self, socketio, fetch, channels=None, resources=None, namespace="/", history=None):
+        self.socketio = socketio
+        self.fetch = fetch  # fetch(resource, path) -> разобранный JSON
+        self.namespace = namespace
+        self.resources = resources or config.TELEMETRY_RESOURCES
+        self.channels = {}
+        self.extractors = {}
+        self.channel_resource = {}
+        for name, spec in (channels or config.TELEMETRY_CHANNELS).items():
+            self.channels[name] = TelemetryEngine(
+                socketio,
+                event=spec.get("event", f"telemetry.{name}"),
+                rate_hz=spec.get("rate_hz"),
+                deadband=spec.get("deadband"),
+                namespace=namespace,
+                room=self.room(name),
+                deltas=spec.get("deltas", False),
+            )
+            if "field" in spec:
+                self.extractors[name] = servo_axes(spec["field"], spec.get("measure", ""),
+                                                   spec.get("precision", 2))
+            else:
+                self.extractors[name] = scalar(spec.get("name", name), spec.get("measure", ""),
+                                               spec.get("precision", 2))
+            self.channel_resource[name] = spec["resource"]
+        # Отсчёты канала TELEMETRY_HISTORY_CHANNEL копятся в истории (до порога deadband)
+        self.history = history if history is not None else telemetry_history
+        self.history_channel = config.TELEMETRY_HISTORY_CHANNEL
+        self.started = False
+
+    @staticmethod
+    def room(channel):
+        return f"telemetry:{channel}"
+
+    # --- Подписки ---
+    def subscribe(self, sid, channels):
+        """Подписывает клиента; возвращает принятые каналы"""
+        accepted = []
+        for name in channels:
+            engine = self.channels.get(name)
+            if engine is None:
+                continue
+            self.socketio.server.enter_room(sid, self.room(name), namespace=self.namespace)
+            if sid not in engine.pending:
+                engine.add_client(sid)
+            accepted.append(name)
+        return accepted
+
+    def unsubscribe(self, sid, channels=None):
+        for name in (channels if channels is not None else list(self.channels)):
+            engine = self.channels.get(name)
+            if engine is None:
+                continue
+            engine.remove_client(sid)
+            self.socketio.server.leave_room(sid, self.room(name), namespace=self.namespace)
+
+    def subscriptions(self, sid):
+        return [name for name, engine in self.channels.items() if sid in engine.pending]
+
+    def send_history(self, sid):
+        """Недавнее окно истории новому клиенту, чтобы график не начинался с пустого"""
+        window = self.history.query(since=time.time() - config.TELEMETRY_HISTORY_WINDOW,
+                                    max_points=config.TELEMETRY_HISTORY_WINDOW_POINTS)
+        self.socketio.emit("telemetry_history", window, to=sid, namespace=self.namespace)
+
+    def active_channels(self, resource):
+        return [name for name, engine in self.channels.items()
+                if self.channel_resource[name] == resource and engine.pending]
+
+    # --- Опрос ---
+    def poll(self, resource):
+        """Фоновый цикл одного ресурса"""
+        path = self.resources[resource]
+        next_due = {}
+        while True:
+            active = self.active_channels(resource)
+            if not active:
+                next_due.clear()
+                self.socketio.sleep(config.TELEMETRY_IDLE_SLEEP)
+                continue
+
+            now = time.monotonic()
+            due = [name for name in active if next_due.get(name, 0) <= now]
+            if due:
+                try:
+                    data = self.fetch(resource, path)
+                except Exception:
+                    data = None
+                for name in due:
+                    engine = self.channels[name]
+                    next_due[name] = max(next_due.get(name, now) + 1.0 / engine.rate_hz, now)
+                    if data is not None:
+                        axes = self.extractors[name](data)
+                        if name == self.history_channel:
+                            self.history.append(axes)
+                        engine.tick(axes, now)
+
+            wait = min(next_due[name] for name in active) - time.monotonic()
+            self.socketio.sleep(max(wait, 0))
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        for resource in set(self.channel_resource.values()):
+            self.socketio.start_background_task(self.poll, resource)
+
+
+# История осей на весь процесс: пишет TelemetryHub, читает /api/telemetry/history
+telemetry_history = TelemetryHistory()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# База пресетов тестов — во временном каталоге, а не preset.db рядом с сервером
+config.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="salaserv-tests-"), "preset.db")
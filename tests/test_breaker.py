@@ -0,0 +1,112 @@
+import time
+import unittest
+
+import requests
+
+from api.breaker import CircuitBreaker, ControllerUnavailable, CLOSED, OPEN
+from api.controller import ControllerClient
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Вместо requests.Session: отдаёт заранее заданные ответы или исключения"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+def make_client(outcomes, failures=2, retries=0):
+    client = ControllerClient(
+        "http://controller.test",
+        retries={"default": {"retries": retries, "backoff": 0}},
+        breaker=CircuitBreaker(failures=failures, backoff=0.01, backoff_max=0.01),
+    )
+    client.session = FakeSession(outcomes)
+    return client
+
+
+def open_breaker(client):
+    for _ in range(client.breaker.max_failures):
+        try:
+            client.get("listing", "/gcore/0/listing")
+        except requests.ConnectionError:
+            pass
+    assert client.breaker.state == OPEN
+    time.sleep(0.02)
+
+
+class HalfOpenTrialTest(unittest.TestCase):
+    def test_non_network_error_in_trial_reopens_breaker(self):
+        client = make_client([requests.ConnectionError("down")])
+        open_breaker(client)
+
+        # Пробный запрос обрывается посреди тела ответа
+        client.session.outcomes = [requests.exceptions.ChunkedEncodingError("reset")]
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            client.get("listing", "/gcore/0/listing")
+        self.assertEqual(client.breaker.state, OPEN)
+
+        # Предохранитель не завис: после паузы снова пропускает пробный запрос
+        time.sleep(0.02)
+        self.assertTrue(client.breaker.due())
+        client.session.outcomes = [200]
+        self.assertEqual(client.get("listing", "/gcore/0/listing").status_code, 200)
+        self.assertEqual(client.breaker.state, CLOSED)
+
+    def test_cancelled_trial_reopens_breaker(self):
+        client = make_client([requests.ConnectionError("down")])
+        open_breaker(client)
+
+        client.session.outcomes = [KeyboardInterrupt()]
+        with self.assertRaises(KeyboardInterrupt):
+            client.get("listing", "/gcore/0/listing")
+        self.assertEqual(client.breaker.state, OPEN)
+
+    def test_other_callers_fail_fast_while_open(self):
+        client = make_client([requests.ConnectionError("down")])
+        open_breaker(client)
+        client.breaker.retry_at = time.monotonic() + 60
+        with self.assertRaises(ControllerUnavailable):
+            client.get("listing", "/gcore/0/listing")
+
+
+class FailureCountingTest(unittest.TestCase):
+    def test_http_5xx_does_not_trip_breaker(self):
+        client = make_client([503], failures=1, retries=2)
+        resp = client.get("listing", "/gcore/0/listing")
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(client.session.calls, 3)
+        self.assertEqual(client.breaker.state, CLOSED)
+
+    def test_retries_count_as_one_failure(self):
+        client = make_client([requests.ConnectionError("down")], failures=2, retries=2)
+        with self.assertRaises(requests.ConnectionError):
+            client.get("listing", "/gcore/0/listing")
+        self.assertEqual(client.session.calls, 3)
+        self.assertEqual(client.breaker.failures, 1)
+        self.assertEqual(client.breaker.state, CLOSED)
+
+    def test_non_network_error_not_counted_when_closed(self):
+        client = make_client([ValueError("bad body")], failures=1)
+        with self.assertRaises(ValueError):
+            client.get("listing", "/gcore/0/listing")
+        self.assertEqual(client.breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
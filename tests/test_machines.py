@@ -0,0 +1,32 @@
+import unittest
+
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+
+from api.machines import Machine
+from api.routes import get_core
+
+
+class GetCoreTest(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_machine_without_gcores_accepts_any_core(self):
+        machine = Machine("m", "http://controller.test")
+        self.assertEqual(machine.gcores, [0])
+        with self.app.test_request_context("/?core=2"):
+            self.assertEqual(get_core(machine, 1), 1)
+            self.assertEqual(get_core(machine), 2)
+
+    def test_configured_gcores_are_checked(self):
+        machine = Machine("m", "http://controller.test", gcores=[0, 1])
+        with self.app.test_request_context("/"):
+            self.assertEqual(get_core(machine), 0)
+            self.assertEqual(get_core(machine, 1), 1)
+            with self.assertRaises(HTTPException) as ctx:
+                get_core(machine, 2)
+            self.assertEqual(ctx.exception.get_response().status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import copy
+import datetime
+import json
+import sqlite3
+import unittest
+
+from flask import Flask
+
+from api import db, jsonpatch, preset_store
+
+
+# Таблица presets в том виде, в каком её создаёт версия без preset_blobs
+LEGACY_SCHEMA = """
+CREATE TABLE presets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    code TEXT NOT NULL,
+    thickness REAL NOT NULL,
+    preset TEXT NOT NULL,
+    status TEXT DEFAULT 'active',
+    ts DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+TS = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def preset(power=80, speed=2500, **extra):
+    data = {
+        "material": {"name": "St37", "thickness": 3},
+        "cutting": {"power": power, "speed": speed, "gas": {"type": "O2", "pressure": 0.6}},
+        "pierce": [{"step": 1, "power": 40}, {"step": 2, "power": 60}],
+    }
+    data.update(extra)
+    return data
+
+
+def legacy_db(*presets):
+    """База прежней версии с пресетами presets; возвращает соединение"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute(LEGACY_SCHEMA)
+    for data in presets:
+        conn.execute("INSERT INTO presets (name, code, thickness, preset) VALUES (?, ?, ?, ?)",
+                     ("St37_3", "St37", 3.0, json.dumps(data)))
+    conn.commit()
+    return conn
+
+
+def current(conn, preset_id):
+    blob_hash, rev = conn.execute("SELECT blob_hash, rev FROM presets WHERE id=?", (preset_id,)).fetchone()
+    return preset_store.get_blob(conn, blob_hash), rev
+
+
+class JsonPatchTest(unittest.TestCase):
+    def assertRoundTrip(self, src, dst):
+        ops = jsonpatch.diff(src, dst)
+        self.assertEqual(jsonpatch.apply(copy.deepcopy(src), ops), dst)
+        # Обратный патч возвращает исходный документ
+        back = jsonpatch.diff(dst, src)
+        self.assertEqual(jsonpatch.apply(copy.deepcopy(dst), back), src)
+
+    def test_nested_dicts(self):
+        self.assertRoundTrip(preset(), preset(power=55))
+        self.assertRoundTrip({"a": {"b": {"c": 1}}}, {"a": {"b": {"c": 2, "d": [1]}}})
+
+    def test_added_and_removed_keys(self):
+        self.assertRoundTrip({"a": 1, "b": 2}, {"b": 2, "c": 3})
+        self.assertRoundTrip(preset(), preset(note="thin sheet"))
+        self.assertRoundTrip({"a": {"x": 1}}, {})
+
+    def test_lists(self):
+        self.assertRoundTrip([1, 2, 3], [1, 5, 3])
+        self.assertRoundTrip([1, 2], [1, 2, 3])
+        self.assertRoundTrip([{"a": 1}, {"b": [1, 2]}], [{"a": 2}, {"b": [1]}])
+        self.assertRoundTrip({"l": []}, {"l": [{"x": None}]})
+
+    def test_type_changes_and_escaped_keys(self):
+        self.assertRoundTrip({"a": 1}, {"a": "1"})
+        self.assertRoundTrip({"a": [1]}, {"a": {"0": 1}})
+        self.assertRoundTrip({"a/b": 1, "c~d": 2}, {"a/b": 3, "c~d": 4})
+        self.assertRoundTrip(1, {"a": 1})
+
+    def test_identical_documents_give_empty_patch(self):
+        self.assertEqual(jsonpatch.diff(preset(), preset()), [])
+
+
+class RevisionsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = legacy_db()
+        preset_store.init_schema(self.conn)
+        self.versions = [preset(power=p) for p in (80, 55, 90)] + [preset(power=90, note="x")]
+        self.id = preset_store.insert_preset(self.conn, "St37_3", "St37", 3.0, self.versions[0], TS)
+        for i, data in enumerate(self.versions[1:], start=1):
+            self.assertTrue(preset_store.update_preset(self.conn, self.id, "St37_3", "St37", 3.0, data,
+                                                       TS + datetime.timedelta(minutes=i)))
+        self.conn.commit()
+
+    def test_every_revision_reconstructed_from_patch_chain(self):
+        for rev, data in enumerate(self.versions, start=1):
+            revision = preset_store.get_revision(self.conn, self.id, rev)
+            self.assertEqual(revision["preset"], data, f"rev {rev}")
+            self.assertEqual(revision["rev"], rev)
+        self.assertIsNone(preset_store.get_revision(self.conn, self.id, len(self.versions) + 1))
+        self.assertIsNone(preset_store.get_revision(self.conn, self.id, 0))
+
+        current_rev, revisions = preset_store.list_revisions(self.conn, self.id)
+        self.assertEqual(current_rev["rev"], len(self.versions))
+        self.assertEqual([r["rev"] for r in revisions], [3, 2, 1])
+
+    def test_only_current_version_keeps_a_blob(self):
+        count = self.conn.execute("SELECT count(*) FROM preset_blobs").fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_identical_save_is_noop(self):
+        self.assertTrue(preset_store.update_preset(self.conn, self.id, "St37_3", "St37", 3.0,
+                                                   copy.deepcopy(self.versions[-1]), TS))
+        data, rev = current(self.conn, self.id)
+        self.assertEqual(rev, len(self.versions))
+        count = self.conn.execute("SELECT count(*) FROM preset_revisions").fetchone()[0]
+        self.assertEqual(count, len(self.versions) - 1)
+
+    def test_rename_with_same_content_keeps_history(self):
+        preset_store.update_preset(self.conn, self.id, "renamed", "St37", 3.0, self.versions[-1], TS)
+        revision = preset_store.get_revision(self.conn, self.id, len(self.versions))
+        self.assertEqual(revision["name"], "St37_3")
+        self.assertEqual(revision["preset"], self.versions[-1])
+
+    def test_update_of_deleted_preset_refused(self):
+        self.conn.execute("UPDATE presets SET status='deleted' WHERE id=?", (self.id,))
+        self.assertFalse(preset_store.update_preset(self.conn, self.id, "St37_3", "St37", 3.0, preset(), TS))
+
+
+class LegacyMigrationTest(unittest.TestCase):
+    def test_migration_keeps_legacy_column(self):
+        conn = legacy_db(preset(power=80), preset(power=70))
+        preset_store.init_schema(conn)
+        for preset_id, power in ((1, 80), (2, 70)):
+            data, rev = current(conn, preset_id)
+            self.assertEqual(data["cutting"]["power"], power)
+            self.assertEqual(rev, 1)
+            legacy = conn.execute("SELECT preset FROM presets WHERE id=?", (preset_id,)).fetchone()[0]
+            # Прежняя версия сервера по-прежнему читает пресет
+            self.assertEqual(json.loads(legacy), data)
+
+    def test_edit_after_rollback_survives_next_upgrade(self):
+        conn = legacy_db(preset(power=80))
+        preset_store.init_schema(conn)
+        preset_store.update_preset(conn, 1, "St37_3", "St37", 3.0, preset(power=85), TS)
+        conn.commit()
+
+        # Откат: прежняя версия меняет только колонку preset, blob_hash не трогает
+        conn.execute("UPDATE presets SET preset=?, ts=? WHERE id=1", (json.dumps(preset(power=55)), TS))
+        # Прежняя версия добавляет пресет без blob
+        conn.execute("INSERT INTO presets (name, code, thickness, preset) VALUES ('new', 'Al', 2, ?)",
+                     (json.dumps(preset(power=30)),))
+        conn.commit()
+
+        # Снова обновление
+        preset_store.init_schema(conn)
+        data, rev = current(conn, 1)
+        self.assertEqual(data["cutting"]["power"], 55)
+        self.assertEqual(rev, 3)
+        self.assertEqual(preset_store.get_revision(conn, 1, 2)["preset"], preset(power=85))
+        self.assertEqual(preset_store.get_revision(conn, 1, 1)["preset"], preset(power=80))
+        self.assertEqual(current(conn, 2)[0]["cutting"]["power"], 30)
+
+        # Повторный запуск ничего не меняет
+        preset_store.init_schema(conn)
+        self.assertEqual(current(conn, 1)[1], 3)
+
+    def test_drop_legacy_json(self):
+        conn = legacy_db(preset(power=80))
+        preset_store.init_schema(conn)
+        self.assertEqual(preset_store.drop_legacy_json(conn), 1)
+        conn.commit()
+        preset_store.insert_preset(conn, "n", "St37", 3.0, preset(power=20), TS)
+        self.assertEqual(conn.execute("SELECT count(*) FROM presets WHERE preset!=''").fetchone()[0], 0)
+
+        # Выбор сохраняется в базе: после перезапуска колонка не заполняется снова
+        preset_store.init_schema(conn)
+        self.assertFalse(preset_store.keep_legacy_json)
+        preset_store.update_preset(conn, 1, "St37_3", "St37", 3.0, preset(power=10), TS)
+        self.assertEqual(conn.execute("SELECT count(*) FROM presets WHERE preset!=''").fetchone()[0], 0)
+        self.assertEqual(current(conn, 1)[0]["cutting"]["power"], 10)
+
+    def tearDown(self):
+        preset_store.keep_legacy_json = True
+
+
+class RestorePresetTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from api.presets import preset_bp
+        app = Flask(__name__)
+        app.register_blueprint(preset_bp, url_prefix="/db")
+        cls.client = app.test_client()
+
+    def setUp(self):
+        with db.connect() as conn:
+            preset_store.delete_all(conn)
+            self.id = preset_store.insert_preset(conn, "St37_3", "St37", 3.0, preset(power=80), TS)
+            preset_store.update_preset(conn, self.id, "St37_3", "St37", 3.0, preset(power=55), TS)
+
+    def test_restore_saves_revision_as_new_version(self):
+        resp = self.client.post("/db/restore_preset", json={"id": self.id, "rev": 1})
+        self.assertEqual(resp.status_code, 200)
+
+        got = self.client.get(f"/db/get_preset?id={self.id}").get_json()
+        self.assertEqual(got["preset"], preset(power=80))
+        revisions = self.client.get(f"/db/preset_revisions?id={self.id}").get_json()
+        self.assertEqual(revisions["current"]["rev"], 3)
+        # Версия, с которой восстанавливали, осталась в истории
+        rev2 = self.client.get(f"/db/get_preset_revision?id={self.id}&rev=2").get_json()
+        self.assertEqual(rev2["preset"], preset(power=55))
+
+    def test_restore_unknown_revision(self):
+        resp = self.client.post("/db/restore_preset", json={"id": self.id, "rev": 9})
+        self.assertEqual(resp.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import datetime
+import unittest
+
+from api import db, preset_store
+from api.presets import list_presets_page
+
+
+def insert(name, ts, status="active"):
+    with db.connect() as conn:
+        preset_id = preset_store.insert_preset(conn, name, "St37", 3.0, {"name": name}, ts)
+        if status != "active":
+            conn.execute("UPDATE presets SET status=? WHERE id=?", (status, preset_id))
+    return preset_id
+
+
+class ListPresetsPageTest(unittest.TestCase):
+    def setUp(self):
+        with db.connect() as conn:
+            preset_store.delete_all(conn)
+
+    def pages(self, limit, **options):
+        ids, cursor = [], None
+        while True:
+            rows, fields, cursor = list_presets_page(limit=limit, cursor=cursor, **options)
+            ids += [row[fields.index("id")] for row in rows]
+            if cursor is None:
+                return ids
+
+    def test_pages_across_equal_ts(self):
+        early = datetime.datetime(2026, 1, 1, 10, 0, 0)
+        late = datetime.datetime(2026, 1, 1, 11, 0, 0)
+        # Пять пресетов с одинаковым ts между двумя другими: граница страницы внутри группы
+        first = insert("first", early)
+        same = [insert(f"same{i}", late) for i in range(5)]
+        last = insert("last", late + datetime.timedelta(minutes=1))
+
+        expected = [last] + sorted(same, reverse=True) + [first]
+        for limit in (1, 2, 3, 7):
+            self.assertEqual(self.pages(limit), expected, f"limit={limit}")
+
+    def test_deleted_presets_skipped_unless_all(self):
+        ts = datetime.datetime(2026, 1, 1, 10, 0, 0)
+        active = insert("active", ts)
+        deleted = insert("deleted", ts, status="deleted")
+        self.assertEqual(self.pages(1), [active])
+        self.assertEqual(self.pages(1, include_all=True), [deleted, active])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from api.singleflight import SingleFlight
+
+
+class LeaderFailureTest(unittest.TestCase):
+    def run_with_waiter(self, error):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        outcome = {}
+
+        def leader_fn():
+            started.set()
+            release.wait(1)
+            raise error
+
+        def leader():
+            try:
+                flight.do("k", leader_fn)
+            except BaseException as e:
+                outcome["leader"] = e
+
+        def waiter():
+            try:
+                outcome["waiter"] = flight.do("k", lambda: "not called")
+            except Exception as e:
+                outcome["waiter"] = e
+
+        t1 = threading.Thread(target=leader)
+        t1.start()
+        started.wait(1)
+        t2 = threading.Thread(target=waiter)
+        t2.start()
+        while flight.stats()["k"]["collapsed"] == 0:
+            pass
+        release.set()
+        t1.join(1)
+        t2.join(1)
+        return outcome
+
+    def test_waiter_gets_leader_exception(self):
+        outcome = self.run_with_waiter(ValueError("bad"))
+        self.assertIsInstance(outcome["leader"], ValueError)
+        self.assertIs(outcome["waiter"], outcome["leader"])
+
+    def test_waiter_fails_when_leader_aborted(self):
+        outcome = self.run_with_waiter(KeyboardInterrupt())
+        self.assertIsInstance(outcome["leader"], KeyboardInterrupt)
+        self.assertIsInstance(outcome["waiter"], RuntimeError)
+
+
+class StatsNameTest(unittest.TestCase):
+    def test_stats_keyed_by_name(self):
+        flight = SingleFlight()
+        for etag in ("a", "b", "c"):
+            self.assertEqual(flight.do(f"preview:{etag}", lambda: etag, name="preview"), etag)
+        self.assertEqual(flight.stats(), {"preview": {"calls": 3, "executed": 3, "collapsed": 0,
+                                                      "in_flight": False}})
+
+
+if __name__ == "__main__":
+    unittest.main()